@@ -0,0 +1,81 @@
+"""
+Compare the time and peak memory of annotating a schema with title paths, with the current and previous implementation.
+
+Usage: python benchmarks/add_paths_to_schema.py [--repeat N] [SCHEMA]
+"""
+
+import copy
+import time
+import tracemalloc
+
+import click
+from scalpl import Cut
+
+from spoonbill.utils import SCHEMA_DIR, add_paths_to_schema, generate_paths, resolve_file_uri, resolve_refs
+
+
+def title_path(schema, path=()):
+    for value in schema.values():
+        newpath = list(path)
+        if "$path" in schema:
+            newpath.append(schema["$path"])
+        if isinstance(value, dict):
+            for result in title_path(value, newpath):
+                if result:
+                    yield result
+        elif newpath:
+            yield newpath
+
+
+def previous_add_paths_to_schema(schema):
+    """Annotate the schema like the implementation before the single pass, which deep-copies the schema twice."""
+    proxy = Cut(copy.deepcopy(schema))
+    updated_items = {}
+    for table in proxy["properties"]:
+        path_item = Cut({table: copy.deepcopy(proxy["properties"][table])})
+        for path in generate_paths({table: proxy["properties"][table]}):
+            if path[-1] == "title":
+                object_path = ".".join(path[:-1])
+                path_item[object_path]["$path"] = path
+        updated_items[table] = path_item[table]
+    proxy["properties"] = updated_items
+    for path_list in list(title_path(proxy["properties"])):
+        location = "properties." + ".".join(path_list[-1][:-1])
+        proxy[location]["$title"] = path_list
+
+    return proxy
+
+
+def measure(function, schema):
+    start = time.perf_counter()
+    function(schema)
+    return time.perf_counter() - start
+
+
+def measure_memory(function, schema):
+    # Tracing memory slows down the function, so it is measured in a separate run.
+    tracemalloc.start()
+    function(schema)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+@click.command()
+@click.option("--repeat", type=click.IntRange(min=1), default=3, show_default=True, help="Runs per implementation")
+@click.argument("schema", default=str(SCHEMA_DIR / "1.1" / "en" / "release-schema.json"))
+def main(schema, repeat):
+    # Resolve the references beforehand, as the data preprocessor does.
+    schema = resolve_refs(resolve_file_uri(schema))
+    if "releases" in schema["properties"]:
+        schema = schema["properties"]["releases"]["items"]
+    click.echo(f"{'implementation':16} {'seconds':>10} {'peak MB':>10}")
+    for name, function in (("previous", previous_add_paths_to_schema), ("current", add_paths_to_schema)):
+        # Report the best run, to reduce the noise from other processes.
+        seconds = min(measure(function, schema) for _ in range(repeat))
+        peak = measure_memory(function, schema)
+        click.echo(f"{name:16} {seconds:>10.3f} {peak / 1024 / 1024:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
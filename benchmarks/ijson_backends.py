@@ -0,0 +1,49 @@
+"""
+Report the throughput of parsing a file with each available ijson backend.
+
+Usage: python benchmarks/ijson_backends.py [--repeat N] FILENAME
+"""
+
+import pathlib
+import time
+
+import click
+
+from spoonbill.common import IJSON_BACKENDS
+from spoonbill.utils import get_ijson_backend, get_reader, iter_file
+
+
+def measure(path, backend, *, pkg_type, multiple_values):
+    reader = get_reader(path)
+    items = 0
+    start = time.perf_counter()
+    with reader(path, "rb") as fd:
+        for _item in iter_file(fd, pkg_type, multiple_values=multiple_values, backend=backend):
+            items += 1
+    return items, time.perf_counter() - start
+
+
+@click.command()
+@click.option("--repeat", type=click.IntRange(min=1), default=3, show_default=True, help="Runs per backend")
+@click.option("--pkg-type", type=click.Choice(["releases", "records"]), default="releases", show_default=True)
+@click.option("--multiple-values", is_flag=True, help="The input is line-delimited JSON")
+@click.argument("filename", type=click.Path(exists=True, dir_okay=False, path_type=pathlib.Path))
+def main(filename, repeat, pkg_type, multiple_values):
+    size = filename.stat().st_size / 1024 / 1024
+    click.echo(f"{'backend':12} {'items':>10} {'seconds':>10} {'MB/s':>10} {'items/s':>12}")
+    for backend in IJSON_BACKENDS[1:]:
+        try:
+            get_ijson_backend(backend)
+        except ValueError:
+            click.echo(f"{backend:12} {'unavailable':>10}")
+            continue
+        # Report the best run, to reduce the noise from other processes and cold caches.
+        items, seconds = min(
+            (measure(filename, backend, pkg_type=pkg_type, multiple_values=multiple_values) for _ in range(repeat)),
+            key=lambda result: result[1],
+        )
+        click.echo(f"{backend:12} {items:>10} {seconds:>10.3f} {size / seconds:>10.2f} {items / seconds:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""
+Report the throughput of analyzing the items of a file with a data preprocessor.
+
+The items are read into memory before the analysis is timed, so that only the analysis is measured.
+
+Usage: python benchmarks/process_items.py [--repeat N] [--schemaless] [--no-preview] FILENAME
+"""
+
+import pathlib
+import time
+
+import click
+
+from spoonbill.common import COMBINED_TABLES, ROOT_TABLES
+from spoonbill.stats import DataPreprocessor
+from spoonbill.utils import SCHEMA_DIR, get_reader, iter_file, resolve_file_uri
+
+
+def measure(schema, items, with_preview):
+    spec = DataPreprocessor(schema, ROOT_TABLES, combined_tables=COMBINED_TABLES)
+    start = time.perf_counter()
+    for _count in spec.process_items(items, with_preview=with_preview):
+        pass
+    return time.perf_counter() - start
+
+
+@click.command()
+@click.option("--repeat", type=click.IntRange(min=1), default=3, show_default=True, help="Runs")
+@click.option("--pkg-type", type=click.Choice(["releases", "records"]), default="releases", show_default=True)
+@click.option("--multiple-values", is_flag=True, help="The input is line-delimited JSON")
+@click.option("--schemaless", is_flag=True, help="Analyze without a schema")
+@click.option("--no-preview", is_flag=True, help="Analyze without collecting previews, like the CLI")
+@click.argument("filename", type=click.Path(exists=True, dir_okay=False, path_type=pathlib.Path))
+def main(filename, repeat, pkg_type, multiple_values, schemaless, no_preview):
+    with get_reader(filename)(filename, "rb") as fd:
+        items = list(iter_file(fd, pkg_type, multiple_values=multiple_values))
+    schema = None if schemaless else resolve_file_uri(SCHEMA_DIR / "1.1" / "en" / "release-schema.json")
+    # Report the best run, to reduce the noise from other processes.
+    seconds = min(measure(schema, items, not no_preview) for _ in range(repeat))
+    click.echo(f"{'items':>10} {'seconds':>10} {'items/s':>12}")
+    click.echo(f"{len(items):>10} {seconds:>10.3f} {len(items) / seconds:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,156 @@
+import contextlib
 import logging
+import pickle
+import tempfile
+from array import array
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
 from operator import attrgetter
 from pathlib import Path
+from urllib.parse import urljoin
 
-import jsonref
-from ocdsextensionregistry import ProfileBuilder
 from ocdskit.util import detect_format
 
-from spoonbill.common import COMBINED_TABLES, CURRENT_SCHEMA_TAG, DEFAULT_SCHEMA_URL, ROOT_TABLES, TABLE_THRESHOLD
+from spoonbill.common import (
+    COMBINED_TABLES,
+    CURRENT_SCHEMA_TAG,
+    DEFAULT_SCHEMA_URL,
+    PARALLEL_CHUNK_SIZE,
+    PREVIEW_ROWS,
+    ROOT_TABLES,
+    TABLE_THRESHOLD,
+)
 from spoonbill.flatten import Flattener
 from spoonbill.i18n import LOCALE, _
-from spoonbill.stats import DataPreprocessor
-from spoonbill.utils import get_order, get_reader, iter_file, resolve_file_uri
+from spoonbill.stats import DataPreprocessor, PreviewCollector
+from spoonbill.utils import (
+    ByteRangeReader,
+    ExtensionProfileBuilder,
+    RewindableReader,
+    Throttle,
+    dump_items,
+    get_byte_ranges,
+    get_input_position,
+    get_order,
+    get_package_extensions,
+    get_reader,
+    get_shape,
+    iter_file,
+    load_items,
+    open_items,
+    open_items_writer,
+    open_stream,
+    resolve_file_uri,
+    resolve_refs,
+)
 from spoonbill.writers import CSVWriter, XlsxWriter
 
 LOGGER = logging.getLogger("spoonbill")
 
+# The pickled data preprocessor that each analysis worker copies before analyzing a byte range.
+_template = None
+# The flattener that each flattening worker uses for all its byte ranges and files.
+_flattener = None
+
+
+def _init_analysis_worker(template):
+    global _template  # noqa: PLW0603
+    _template = template
+
+
+def _analyze_range(path, start, end, pkg_type, backend, with_preview, first):
+    """
+    Analyze a byte range of a line-delimited file in a worker process.
+
+    The first byte range of the input is analyzed in full. The other byte ranges are summarized, so that the main
+    process continues the analysis in order with :meth:`DataPreprocessor.process_shapes`: the first items, which can
+    set values in the previews, are returned as is, and the other items by their shapes. If collecting previews, the
+    other items are also analyzed, and those that add preview rows are returned as is, as they likely do in the main
+    process.
+
+    :param first: Whether the byte range is the first of the input
+    :return: The number of items, and either the data preprocessor without its schema, or the first items, the
+             distinct shapes of the other items, the index of the shape of each other item, and the items that add
+             preview rows by index or None
+    """
+    spec = pickle.loads(_template)  # noqa: S301 # our data
+    with open(path, "rb") as fd:
+        items = iter_file(ByteRangeReader(fd, start, end), pkg_type, multiple_values=True, backend=backend)
+        if first:
+            items_count = 0
+            for count in spec.process_items(items, with_preview=with_preview, clean_up=False):
+                items_count = count + 1
+            spec.schema = None
+            return items_count, spec
+
+        with_preview = with_preview and spec.preview is not None
+        leading = list(islice(items, spec.preview.rows if with_preview else 0))
+        shapes = {}
+        sequence = array("L")
+        # The items that add preview rows, by index in the sequence.
+        releases = {} if with_preview else None
+        preview_rows = 0
+        for index, item in enumerate(items):
+            sequence.append(shapes.setdefault(get_shape(item), len(shapes)))
+            if with_preview:
+                for _count in spec.process_items([item], start=len(leading) + index, clean_up=False):
+                    pass
+                rows = sum(len(table.preview_rows) for table in spec.tables.values())
+                if rows > preview_rows:
+                    releases[index] = item
+                    preview_rows = rows
+    return len(leading) + len(sequence), (leading, list(shapes), sequence, releases)
+
+
+def _init_flatten_worker(flattener):
+    global _flattener  # noqa: PLW0603
+    _flattener = pickle.loads(flattener)  # noqa: S301 # our data
+
+
+def _flatten_range(path, start, end, pkg_type, multiple_values, backend, spool_dir):
+    """
+    Flatten a file, or a byte range of a line-delimited file, in a worker process.
+
+    The rows of a byte range are returned, as its size is bounded. The rows of a whole file are written to an item
+    cache in ``spool_dir`` instead, so that the memory used doesn't grow with the size of the file.
+
+    :return: The number of items flattened, and either a mapping between table names and rows in input order, or the
+             filename of an item cache of such mappings, one per item
+    """
+    items_count = 0
+    reader = get_reader(path)
+    with reader(path, "rb") as fd:
+        if end is not None:
+            fd = ByteRangeReader(fd, start, end)
+        items = iter_file(fd, pkg_type, multiple_values=multiple_values, backend=backend)
+        if end is not None:
+            data = defaultdict(list)
+            for count, rows in _flattener.flatten(items):
+                items_count = count + 1
+                for table, table_rows in rows.items():
+                    data[table].extend(dict(row) for row in table_rows)
+            return items_count, data
+        data = (
+            {table: [dict(row) for row in table_rows] for table, table_rows in rows.items()}
+            for _count, rows in _flattener.flatten(items)
+        )
+        with tempfile.NamedTemporaryFile(dir=spool_dir, delete=False) as spool:
+            for _data in dump_items(data, open_items_writer(spool)):
+                items_count += 1
+        return items_count, spool.name
+
+
+def _map_ordered(pool, func, tasks, limit):
+    """Yield the results of ``func`` on each task in order, with at most ``limit`` tasks submitted at once."""
+    pending = deque()
+    for task in tasks:
+        pending.append(pool.submit(func, *task))
+        if len(pending) >= limit:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
 
 class FileAnalyzer:
     """
@@ -27,6 +163,12 @@ class FileAnalyzer:
     :param pkg_type: Field name to access records
     :param language: Language to use for the human-readable headings
     :param table_threshold: The maximum number of elements in an array before it is split into a table
+    :param backend: The ijson backend to use, or "auto" to use the fastest available backend
+    :param tables_cache: A directory in which to cache the tables parsed from the schema, or None to not cache them
+    :param extensions: Whether to patch the default schema with the extensions that a package declares
+    :param extension_dir: A directory from which to read the extensions, before fetching them
+    :param schemaless: Whether to infer the tables from the data only, without a schema
+    :param preview_rows: The number of rows to preview per table
     """
 
     def __init__(
@@ -39,8 +181,21 @@ class FileAnalyzer:
         pkg_type="releases",
         language=LOCALE,
         table_threshold=TABLE_THRESHOLD,
+        *,
+        backend="auto",
+        tables_cache=None,
+        extensions=False,
+        extension_dir=None,
+        schemaless=False,
+        preview_rows=PREVIEW_ROWS,
     ):
         self.workdir = Path(workdir)
+        self.backend = backend
+        self.tables_cache = tables_cache
+        self.extensions = extensions
+        self.extension_dir = extension_dir
+        self.schemaless = schemaless
+        self.preview_rows = preview_rows
         self.multiple_values = False
         self.schema = schema
         self.root_tables = root_tables
@@ -54,44 +209,189 @@ class FileAnalyzer:
             self.spec = None
         self.pkg_type = pkg_type
         self.order = None
+        self.spool = None
 
-    def analyze_file(self, filenames, *, with_preview=True):  # noqa: ARG002
+    def analyze_file(self, filenames, *, with_preview=True, workers=1, spool=False, cache=None, progress=None):
         """
         Analyze provided file.
 
-        :param filename: Input filename
-        :param with_preview: Generate preview during analysis
+        Yields the number of bytes read from the input file and the index of the item, for each item. If the input
+        file is compressed, the bytes read are those of the compressed file. To limit overhead, the bytes read are
+        measured, and ``progress`` is called, at most once per ``PROGRESS_INTERVAL`` seconds and after each file.
+
+        If ``workers`` is greater than 1, uncompressed line-delimited files are split into byte ranges, which are
+        summarized in parallel and analyzed in order, with the same result as a serial analysis.
+
+        If ``spool`` is set, the parsed items are also written to a temporary file, from which a ``FileFlattener``
+        created with this analyzer reads them, instead of decompressing and parsing the input again. If ``cache`` is
+        set, the items are written to that file instead, which a ``FileFlattener`` can read later.
+
+        The input can also be a binary file-like object, like ``sys.stdin.buffer``, which is read only once. Its format
+        and compression are sniffed from the data read first, and the parsed items are spooled in compressed form.
+
+        :param filename: Input filename, or binary file-like object
+        :param with_preview: Generate preview during analysis. If not set, previews are skipped entirely.
+        :param workers: Number of worker processes to use
+        :param spool: Keep the parsed items for flattening
+        :param cache: Filename in working directory to which to write the parsed items
+        :param progress: A function to call with the number of bytes read and the index of the item
         """
-        if not isinstance(filenames, list):
-            filenames = [filenames]
-        path = self.workdir / filenames[0]
+        stream = None
+        if hasattr(filenames, "read"):
+            source = open_stream(filenames)
+            # Keep the data that is read to detect the format, to parse it again.
+            stream = RewindableReader(source)
+            path = getattr(filenames, "name", "-")
+            filenames = [stream]
+
+            def reader(_path, _mode):
+                return contextlib.nullcontext(stream)
+
+        else:
+            if not isinstance(filenames, list):
+                filenames = [filenames]
+            path = self.workdir / filenames[0]
+            reader = get_reader(path)
         (
             input_format,
             _is_concatenated,
             _is_array,
-        ) = detect_format(path=path, reader=get_reader(path))
+        ) = detect_format(path=path, reader=reader)
+        extensions = None
+        if self.extensions and not self.schema and not self.schemaless and "package" in input_format:
+            if stream:
+                # Keep the data that is read to find the extensions, to parse it again.
+                stream.rewind(keep=True)
+            with reader(path, "rb") as fd:
+                extensions = get_package_extensions(fd, backend=self.backend)
+        if stream:
+            stream.rewind()
         LOGGER.info(_("Input file is {}").format(input_format))
         self.multiple_values = _is_concatenated
-        self.parse_schema(input_format, self.schema)
-        if self.spec is None:
-            self.spec = DataPreprocessor(
-                self.schema,
-                self.root_tables,
-                combined_tables=self.combined_tables,
-                language=self.language,
-                table_threshold=self.table_threshold,
-                multiple_values=self.multiple_values,
-                pkg_type=self.pkg_type,
-            )
+        self.parse_schema(input_format, self.schema, extensions=extensions)
+        restored = self.spec is not None
+        if not restored:
+            self.spec = self.new_spec()
+        if cache:
+            self.spool = open(self.workdir / cache, "w+b")  # noqa: SIM115 # closed with the analyzer
+        elif spool or stream:
+            self.spool = tempfile.TemporaryFile()  # noqa: SIM115 # closed with the analyzer
+        elif workers > 1 and self.multiple_values and all(get_reader(self.workdir / f) is open for f in filenames):
+            paths = [self.workdir / filename for filename in filenames]
+            for read, count in self._analyze_parallel(paths, workers, restored=restored, with_preview=with_preview):
+                if progress:
+                    progress(read, count)
+                yield read, count
+            self.spec.resolve_headers()
+            self.sort_tables()
+            return
+        writer = None
+        if self.spool:
+            # If the input can't be read again, all of it is spooled. Compress it, to limit disk usage.
+            writer = open_items_writer(self.spool, compress=bool(stream) and not cache)
+        throttle = Throttle()
         for filename in filenames:
-            path = self.workdir / filename
-            reader = get_reader(path)
+            if not stream:
+                path = self.workdir / filename
+                reader = get_reader(path)
             with reader(path, "rb") as fd:
-                items = iter_file(fd, self.pkg_type, multiple_values=self.multiple_values)
-                for count in self.spec.process_items(items):
-                    yield fd.tell(), count
+                items = iter_file(fd, self.pkg_type, multiple_values=self.multiple_values, backend=self.backend)
+                if writer:
+                    items = dump_items(items, writer)
+                read = 0
+                count = None
+                for count in self.spec.process_items(items, with_preview=with_preview):
+                    if throttle():
+                        read = get_input_position(fd)
+                        if progress:
+                            progress(read, count)
+                    yield read, count
+                if progress and count is not None:
+                    progress(get_input_position(fd), count)
+        if stream:
+            source.close()
+        if writer is not self.spool:
+            # Write the gzip trailer. This doesn't close the spool.
+            writer.close()
+        if self.spool:
+            self.spool.flush()
+        self.spec.resolve_headers()
         self.sort_tables()
 
+    def new_spec(self):
+        """Create a data preprocessor from the analyzer's configuration."""
+        return DataPreprocessor(
+            self.schema,
+            self.root_tables,
+            combined_tables=self.combined_tables,
+            language=self.language,
+            table_threshold=self.table_threshold,
+            multiple_values=self.multiple_values,
+            pkg_type=self.pkg_type,
+            tables_cache=self.tables_cache,
+            preview=PreviewCollector(self.preview_rows),
+        )
+
+    def _analyze_parallel(self, paths, workers, *, restored, with_preview):
+        template = self.new_spec() if restored else self.spec
+        schema = template.schema
+        spec = self.spec if restored else None
+        tasks = []
+        # Whether each task is the last of its file, after which the array columns without hits are dropped.
+        last = []
+        for path in paths:
+            parts = max(workers, path.stat().st_size // PARALLEL_CHUNK_SIZE)
+            # An empty file is a part, so that it is read as in a serial analysis.
+            for start, end in get_byte_ranges(path, parts) or [(0, 0)]:
+                first = spec is None and not tasks
+                tasks.append((path, start, end, self.pkg_type, self.backend, with_preview, first))
+                last.append(False)
+            last[-1] = True
+        LOGGER.info(_("Analyzing {} parts of input in {} processes").format(len(tasks), workers))
+        read = 0
+        offset = 0
+        with ProcessPoolExecutor(
+            workers, initializer=_init_analysis_worker, initargs=(pickle.dumps(template),)
+        ) as pool:
+            # Continue the analysis in input order, so that the result is that of a serial analysis.
+            results = _map_ordered(pool, _analyze_range, tasks, workers * 2)
+            for task, is_last, (items_count, result) in zip(tasks, last, results, strict=True):
+                path, start, end, *_args, first = task
+                if first:
+                    spec = result
+                    spec.schema = schema
+                else:
+                    self._continue_analysis(spec, path, start, end, offset, result, with_preview=with_preview)
+                offset += items_count
+                if is_last:
+                    spec.clean_up_missing_arrays()
+                    offset = 0
+                read += end - start
+                yield read, spec.total_items
+        self.spec = spec
+
+    def _continue_analysis(self, spec, path, start, end, offset, summary, *, with_preview):
+        """
+        Continue an analysis with a byte range of a line-delimited file that :func:`_analyze_range` summarized.
+
+        :param spec: The data preprocessor
+        :param offset: The index in the file of the first item of the byte range
+        :param summary: The summary of the byte range
+        """
+        leading, shapes, sequence, releases = summary
+        for _count in spec.process_items(leading, with_preview=with_preview, start=offset, clean_up=False):
+            pass
+        offset += len(leading)
+        if not spec.process_shapes(shapes, sequence, start=offset, releases=releases):
+            # Another item adds preview rows, so the items are analyzed in full.
+            with open(path, "rb") as fd:
+                items = iter_file(
+                    ByteRangeReader(fd, start, end), self.pkg_type, multiple_values=True, backend=self.backend
+                )
+                items = islice(items, len(leading), None)
+                for _count in spec.process_items(items, with_preview=with_preview, start=offset, clean_up=False):
+                    pass
+
     def dump_to_file(self, filename):
         """
         Save analyzed information to file.
@@ -101,7 +401,19 @@ class FileAnalyzer:
         path = self.workdir / filename
         self.spec.dump(path)
 
-    def parse_schema(self, input_format, schema=None):
+    def parse_schema(self, input_format, schema=None, extensions=None):
+        """
+        Set the schema of the items of the input, and the type of package.
+
+        If no schema is provided, the default schema is used. If extensions are provided, it is patched with them. They
+        are read from the analyzer's extension directory, if any, or fetched with :func:`spoonbill.utils.fetch`. If the
+        analyzer is schemaless, no schema is used.
+
+        :param input_format: The format detected by ``ocdskit.util.detect_format``
+        :param schema: A schema file URI, or None
+        :param extensions: The URLs of the extensions to patch the default schema with, or None
+        """
+        documents = {}
         if schema:
             schema = resolve_file_uri(schema)
         if "release" in input_format:
@@ -112,16 +424,30 @@ class FileAnalyzer:
             getter = attrgetter("record_package_schema")
         else:
             raise NotImplementedError(f"{input_format} format is not implemented")
+        if self.schemaless:
+            LOGGER.info(_("No schema used, inferring the tables from the data"))
+            self.schema = None
+            self.pkg_type = pkg_type
+            return
         url = DEFAULT_SCHEMA_URL[pkg_type].get(self.language[:2], DEFAULT_SCHEMA_URL[pkg_type]["en"])
         if not schema:
             LOGGER.info(_("No schema provided, using version {}").format(CURRENT_SCHEMA_TAG))
-            profile = ProfileBuilder(CURRENT_SCHEMA_TAG, {}, schema_base_url=url)
-            schema = getter(profile)()
+            profile = ExtensionProfileBuilder(
+                CURRENT_SCHEMA_TAG, extensions or [], extension_dir=self.extension_dir, schema_base_url=url
+            )
+            # Pass the package schema, so that the standard isn't downloaded. It's bundled or cached.
+            schema = getter(profile)(schema=resolve_file_uri(url))
+            if extensions:
+                LOGGER.info(_("Patching the schema with {} extensions").format(len(extensions)))
+                # Resolve the package schema's reference to the release schema to the patched release schema.
+                release_schema_url = urljoin(url, "release-schema.json")
+                patched = profile.patched_release_schema(schema=resolve_file_uri(release_schema_url))
+                documents[release_schema_url] = patched
         title = schema.get("title", "").lower()
         if not title:
             raise ValueError(_("Incomplete schema, please make sure your data is correct"))
         if "package" in title:
-            schema = jsonref.JsonRef.replace_refs(schema)
+            schema = resolve_refs(schema, documents=documents)
             schema = schema["properties"][pkg_type]["items"]
 
         self.schema = schema
@@ -129,7 +455,14 @@ class FileAnalyzer:
 
     def sort_tables(self):
         """Sort tables according to order of arrays in schema."""
-        self.order = get_order(self.spec.schema["properties"].keys())
+        if self.spec.schema is None:
+            # Order the tables like the fields of their root tables.
+            properties = dict.fromkeys(
+                path.split("/")[1] for paths in self.spec.root_tables.values() for path in paths
+            )
+        else:
+            properties = self.spec.schema["properties"].keys()
+        self.order = get_order(properties)
         out_schema_tables = {
             name: table for name, table in self.spec.tables.items() if name.split("_")[0] not in self.order
         }
@@ -159,6 +492,8 @@ class FileFlattener:
     :param csv: If True generate cvs files
     :param xlsx: Generate combined xlsx table
     :param language: Language to use for the human-readable headings
+    :param cache: Filename in working directory of a cache written by ``FileAnalyzer.analyze_file``, to read instead
+    :param backend: The ijson backend to use, or "auto" to use the analyzer's backend or the fastest available backend
     """
 
     def __init__(
@@ -174,6 +509,8 @@ class FileFlattener:
         *,
         multiple_values=False,
         schema=None,
+        cache=None,
+        backend="auto",
     ):
         self.tables = tables or analyzer.spec.tables
         self.flattener = Flattener(options, self.tables, language=language)
@@ -184,27 +521,115 @@ class FileFlattener:
         self.multiple_values = multiple_values or (analyzer.multiple_values if analyzer else False)
         self.pkg_type = pkg_type or (analyzer.pkg_type if analyzer else "releases")
         self.schema = schema or analyzer.spec.schema
+        self.spool = analyzer.spool if analyzer else None
+        self.cache = cache
+        self.backend = analyzer.backend if analyzer and backend == "auto" else backend
 
-    def _flatten(self, filenames, writers):
+    def _flatten(self, filenames, writers, workers):
+        if self.cache:
+            with open(self.workdir / self.cache, "rb") as fd:
+                yield from self._write_items(load_items(open_items(fd)), writers)
+            return
+        if self.spool:
+            self.spool.seek(0)
+            yield from self._write_items(load_items(open_items(self.spool)), writers)
+            return
+        if hasattr(filenames, "read"):
+            with open_stream(filenames) as fd:
+                items = iter_file(fd, self.pkg_type, multiple_values=self.multiple_values, backend=self.backend)
+                yield from self._write_items(items, writers)
+            return
         if not isinstance(filenames, list):
             filenames = [filenames]
+        tasks = self._flatten_tasks(filenames, workers) if workers > 1 else []
+        # A single part, like a compressed file, is flattened in this process, while reading it.
+        if len(tasks) > 1:
+            yield from self._flatten_parallel(tasks, writers, workers)
+            return
         for filename in filenames:
             path = self.workdir / filename
             reader = get_reader(path)
             with reader(path, "rb") as fd:
-                items = iter_file(fd, self.pkg_type, multiple_values=self.multiple_values)
-                for count, data in self.flattener.flatten(items):
-                    for table, rows in data.items():
-                        for row in rows:
-                            for wr in writers:
-                                wr.writerow(table, row)
-                    yield count
-
-    def flatten_file(self, filename):
+                items = iter_file(fd, self.pkg_type, multiple_values=self.multiple_values, backend=self.backend)
+                yield from self._write_items(items, writers)
+
+    def _report(self, counts, progress):
+        if not progress:
+            yield from counts
+            return
+        throttle = Throttle()
+        count = None
+        for count in counts:
+            if throttle():
+                progress(count)
+            yield count
+        if count is not None:
+            progress(count)
+
+    def _write_items(self, items, writers):
+        for count, data in self.flattener.flatten(items):
+            self._write_rows(data, writers)
+            yield count
+
+    def _write_rows(self, data, writers):
+        for table, rows in data.items():
+            for row in rows:
+                for wr in writers:
+                    wr.writerow(table, row)
+
+    def _flatten_tasks(self, filenames, workers):
+        """Return the arguments of :func:`_flatten_range` for each part of the input, without ``spool_dir``."""
+        tasks = []
+        for filename in filenames:
+            path = self.workdir / filename
+            if self.multiple_values and get_reader(path) is open:
+                parts = max(workers, path.stat().st_size // PARALLEL_CHUNK_SIZE)
+                tasks.extend(
+                    (path, start, end, self.pkg_type, True, self.backend)
+                    for start, end in get_byte_ranges(path, parts)
+                )
+            else:
+                tasks.append((path, None, None, self.pkg_type, self.multiple_values, self.backend))
+        return tasks
+
+    def _flatten_parallel(self, tasks, writers, workers):
+        LOGGER.info(_("Flattening {} parts of input in {} processes").format(len(tasks), workers))
+        total = 0
+        with (
+            tempfile.TemporaryDirectory() as spool_dir,
+            ProcessPoolExecutor(
+                workers, initializer=_init_flatten_worker, initargs=(pickle.dumps(self.flattener),)
+            ) as pool,
+        ):
+            tasks = [(*task, spool_dir) for task in tasks]
+            # Rows are written in input order, so that the output is the same as a serial flattening.
+            for items_count, data in _map_ordered(pool, _flatten_range, tasks, workers * 2):
+                if isinstance(data, str):
+                    with open(data, "rb") as fd:
+                        for item_data in load_items(open_items(fd)):
+                            self._write_rows(item_data, writers)
+                    Path(data).unlink()
+                else:
+                    self._write_rows(data, writers)
+                total += items_count
+                if items_count:
+                    yield total - 1
+
+    def flatten_file(self, filename, *, workers=1, progress=None):
         """
         Flatten file.
 
-        :param filename: Input filename in working directory
+        If ``workers`` is greater than 1, uncompressed line-delimited files and lists of files are flattened in
+        parallel. The rows are written in input order, so the output is the same as flattening in a single process. A
+        single file that can't be split, like a compressed file, is flattened in this process.
+
+        If the analyzer spooled the parsed items, or if a cache is set, the parsed items are flattened instead of the
+        input file. The analyzer always spools the items of a file-like input.
+
+        :param filename: Input filename in working directory, or binary file-like object
+        :param workers: Number of worker processes to use
+        :param progress: A function to call with the index of the item, at most once per ``PROGRESS_INTERVAL`` seconds
+            and at the end
         """
         workdir = self.workdir
 
@@ -216,8 +641,9 @@ class FileFlattener:
                 self.flattener.tables,
                 self.flattener.options,
                 schema=self.schema,
+                language=self.flattener.language,
             ) as writer:
-                yield from self._flatten(filename, [writer])
+                yield from self._report(self._flatten(filename, [writer], workers), progress)
         if self.xlsx and not self.csv:
             with XlsxWriter(
                 self.workdir,
@@ -225,8 +651,9 @@ class FileFlattener:
                 self.flattener.options,
                 filename=self.xlsx,
                 schema=self.schema,
+                language=self.flattener.language,
             ) as writer:
-                yield from self._flatten(filename, [writer])
+                yield from self._report(self._flatten(filename, [writer], workers), progress)
 
         if self.xlsx and self.csv:
             with (
@@ -236,12 +663,14 @@ class FileFlattener:
                     self.flattener.options,
                     filename=self.xlsx,
                     schema=self.schema,
+                    language=self.flattener.language,
                 ) as xlsx,
                 CSVWriter(
                     workdir,
                     self.flattener.tables,
                     self.flattener.options,
                     schema=self.schema,
+                    language=self.flattener.language,
                 ) as csv,
             ):
-                yield from self._flatten(filename, [xlsx, csv])
+                yield from self._report(self._flatten(filename, [xlsx, csv], workers), progress)
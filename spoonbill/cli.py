@@ -1,5 +1,6 @@
 """Command line interface-related routines."""
 
+import itertools
 import logging
 import pathlib
 
@@ -7,10 +8,10 @@ import click
 import click_logging
 
 from spoonbill import FileAnalyzer, FileFlattener
-from spoonbill.common import COMBINED_TABLES, ROOT_TABLES, TABLE_THRESHOLD
+from spoonbill.common import COMBINED_TABLES, IJSON_BACKENDS, ROOT_TABLES, TABLE_THRESHOLD, TABLES_CACHE_DIR
 from spoonbill.flatten import FlattenOptions
 from spoonbill.i18n import LOCALE, _
-from spoonbill.utils import read_lines
+from spoonbill.utils import get_ijson_backend, read_lines
 
 LOGGER = logging.getLogger("spoonbill")
 click_logging.basic_config(LOGGER)
@@ -51,10 +52,19 @@ def get_selected_tables(base, selection):
     "--schema",
     help=_(
         "A JSON schema file URI. The URI can be a file path or an HTTP link. Spoonbill uses the schema to analyze the "
-        "provided JSON file. Defaults to the OCDS 1.1.5 release schema (requires internet connection)"
+        "provided JSON file. Defaults to the OCDS 1.1.5 release schema (bundled in English, otherwise downloaded once)"
     ),
     type=str,
 )
+@click.option(
+    "--schemaless",
+    help=_(
+        "Don't use a schema. Infer the tables, columns and types from the data only, which is faster for data that "
+        "doesn't follow OCDS closely. Human-readable headings are formatted from the column paths"
+    ),
+    is_flag=True,
+    default=False,
+)
 @click.option(
     "--selection",
     type=CommaSeparated(),
@@ -166,11 +176,69 @@ def get_selected_tables(base, selection):
     show_default=True,
     type=click.Choice(["en", "es"]),
 )
+@click.option(
+    "--workers",
+    help=_("The number of processes to use to analyze and flatten line-delimited JSON files"),
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+)
+@click.option(
+    "--single-pass",
+    help=_(
+        "Read the input file only once, keeping the parsed data in a temporary file between analysis and flattening. "
+        "Disabled by default"
+    ),
+    is_flag=True,
+    default=False,
+)
+@click.option(
+    "--cache",
+    help=_(
+        "A file path to a cache of the parsed input. The cache is written during analysis, and is read instead of the "
+        "input file when flattening with --state-file. Disabled by default"
+    ),
+    type=click.Path(),
+)
+@click.option(
+    "--cache-tables",
+    help=_(
+        "Cache the tables parsed from the schema in {}, to reuse them in later runs with the same schema and "
+        "options. Disabled by default"
+    ).format(TABLES_CACHE_DIR),
+    is_flag=True,
+    default=False,
+)
+@click.option(
+    "--extensions",
+    help=_(
+        "Patch the default schema with the extensions that the input package declares, to analyze their fields "
+        "up front. The extensions are downloaded once. Disabled by default"
+    ),
+    is_flag=True,
+    default=False,
+)
+@click.option(
+    "--extension-dir",
+    help=_(
+        "A directory of extensions, each in a subdirectory named like the extension's repository, "
+        "e.g. ocds_lots_extension. Use with --extensions, to read extensions from it instead of downloading them"
+    ),
+    type=click.Path(exists=True, file_okay=False),
+)
+@click.option(
+    "--ijson-backend",
+    help=_("The ijson backend to use to parse the input file. 'auto' uses the fastest available backend"),
+    type=click.Choice(IJSON_BACKENDS),
+    default="auto",
+    show_default=True,
+)
 @click_logging.simple_verbosity_option(LOGGER)
-@click.argument("filename", type=click.Path(exists=True))
+@click.argument("filename", type=click.Path(exists=True, allow_dash=True))
 def cli(
     filename,
     schema,
+    schemaless,
     selection,
     threshold,
     state_file,
@@ -187,6 +255,13 @@ def cli(
     count,
     human,
     language,
+    workers,
+    single_pass,
+    cache,
+    cache_tables,
+    extensions,
+    extension_dir,
+    ijson_backend,
 ):
     """Spoonbill CLI entry point."""
     if csv:
@@ -198,9 +273,28 @@ def cli(
         if not xlsx.parent.exists():
             raise click.BadParameter(_("Desired location {} does not exists").format(xlsx.parent))
 
+    if cache:
+        cache = pathlib.Path(cache).resolve()
+        if state_file and not cache.exists():
+            raise click.BadParameter(_("Cache file {} does not exists").format(cache))
+
+    if schema and schemaless:
+        raise click.BadParameter(_("--schema and --schemaless can't be used together"))
+
+    try:
+        get_ijson_backend(ijson_backend)
+    except ValueError as e:
+        raise click.BadParameter(str(e)) from e
+
     path = pathlib.Path(filename)
     workdir = path.parent
     filename = path.name
+    if filename == "-":
+        # Standard input is read only once, so the analyzer spools the parsed items for flattening.
+        source = click.get_binary_stream("stdin")
+        filename = "stdin"
+    else:
+        source = filename
     selection = selection or ROOT_TABLES.keys()
     combine = combine or COMBINED_TABLES.keys()
     root_tables = get_selected_tables(ROOT_TABLES, selection)
@@ -208,7 +302,7 @@ def cli(
 
     if state_file:
         click.secho(_("Restoring from provided state file"), bold=True)
-        analyzer = FileAnalyzer(workdir, state_file=state_file)
+        analyzer = FileAnalyzer(workdir, state_file=state_file, backend=ijson_backend)
     else:
         click.secho(_("State file not supplied, going to analyze input file first"), bold=True)
         analyzer = FileAnalyzer(
@@ -218,20 +312,35 @@ def cli(
             combined_tables=combined_tables,
             language=language,
             table_threshold=threshold,
+            backend=ijson_backend,
+            tables_cache=TABLES_CACHE_DIR if cache_tables else None,
+            extensions=extensions,
+            extension_dir=extension_dir,
+            schemaless=schemaless,
         )
         click.echo(_("Analyze options:"))
         for name, option in ("threshold", str(threshold)), ("language", language):
             click.echo(_(" - {:30} => {}").format(name, click.style(option, fg="cyan")))
         click.echo(_("Processing file: {}").format(click.style(str(path), fg="cyan")))
-        total = path.stat().st_size
-        progress = 0
+        # Without a length, the progress bar shows the position only.
+        size = {"length": path.stat().st_size} if source is filename else {"iterable": itertools.count()}
         # Progress bar not showing with small files
         # https://github.com/pallets/click/pull/1296/files
-        with click.progressbar(width=0, show_percent=True, show_pos=True, length=total) as bar:
-            for read, number in analyzer.analyze_file(filename, with_preview=False):
+        with click.progressbar(width=0, show_percent=True, show_pos=True, **size) as bar:
+
+            def update_analyzed(read, number):
                 bar.label = ANALYZED_LABEL.format(click.style(str(number), fg="cyan"))
-                bar.update(read - progress)
-                progress = read
+                bar.update(read - bar.pos)
+
+            for _read, number in analyzer.analyze_file(  # noqa: B007 # reported after the loop
+                source,
+                with_preview=False,
+                workers=workers,
+                spool=single_pass,
+                cache=cache,
+                progress=update_analyzed,
+            ):
+                pass
         click.secho(
             _("Done processing. Analyzed objects: {}").format(click.style(str(number + 1), fg="red")), fg="green"
         )
@@ -304,6 +413,7 @@ def cli(
         csv=csv,
         xlsx=xlsx,
         language=language,
+        cache=cache,
     )
 
     click.echo(
@@ -316,14 +426,20 @@ def cli(
         click.echo(message)
     click.echo(_("Flattening input file"))
     with click.progressbar(
-        flattener.flatten_file(filename),
         length=analyzer.spec.total_items + 1,
         width=0,
         show_percent=True,
         show_pos=True,
     ) as bar:
-        for counter in bar:
+
+        def update_flattened(counter):
             bar.label = FLATTENED_LABEL.format(click.style(str(counter + 1), fg="cyan"))
+            bar.update(counter + 1 - bar.pos)
+
+        for counter in flattener.flatten_file(source, workers=workers, progress=update_flattened):  # noqa: B007
+            pass
+    if analyzer.spool:
+        analyzer.spool.close()
 
     click.secho(
         _("Done flattening. Flattened objects: {}").format(click.style(str(counter + 1), fg="red")), fg="green"
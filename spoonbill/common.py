@@ -1,3 +1,6 @@
+import os
+from pathlib import Path
+
 SEPARATOR = "/"
 
 # we can try to infer tables from  schema
@@ -46,15 +49,37 @@ ARRAY = "array of {}"
 JOINABLE = "joinable"
 JOINABLE_SEPARATOR = ";"
 TABLE_THRESHOLD = 5
+# The maximum number of distinct paths whose segments and array indexes are kept, while analyzing and flattening.
+PATH_CACHE_SIZE = 65536
+# The approximate size of the byte ranges of a line-delimited file that are analyzed and flattened in parallel.
+PARALLEL_CHUNK_SIZE = 16 * 1024 * 1024
+# The maximum number of distinct shapes of items that are kept, while analyzing in parallel.
+SHAPE_CACHE_SIZE = 65536
+# The size of the blocks that are decompressed ahead of the parser, and the maximum number of blocks to buffer.
+READ_AHEAD_BLOCK_SIZE = 1024 * 1024
+READ_AHEAD_BLOCKS = 8
+# The maximum number of bytes of a stream that are kept in memory, to read them again after sniffing its format. Any
+# other kept bytes are written to a compressed temporary file.
+REWIND_BUFFER_SIZE = 16 * 1024 * 1024
+# The minimum number of seconds between progress reports.
+PROGRESS_INTERVAL = 0.25
+# The ijson backends that can be selected, in descending order of speed. "auto" uses the fastest available backend.
+IJSON_BACKENDS = ("auto", "yajl2_c", "yajl2_cffi", "python")
 CURRENT_SCHEMA_TAG = "1__1__5"
 CURRENT_URL_TAG = "1.1"
+STANDARD_URL = "https://standard.open-contracting.org/"
+# The files fetched by URL are cached in this directory, and never expire.
+CACHE_DIR = Path(os.getenv("XDG_CACHE_HOME") or Path.home() / ".cache") / "spoonbill"
+# The tables parsed from a schema are cached in this directory, if enabled. Increment the version if they change.
+TABLES_CACHE_DIR = CACHE_DIR / "tables"
+TABLES_CACHE_VERSION = 6
 DEFAULT_SCHEMA_URL = {
     "releases": {
-        "en": f"https://standard.open-contracting.org/{CURRENT_URL_TAG}/en/release-package-schema.json",
-        "es": f"https://standard.open-contracting.org/{CURRENT_URL_TAG}/es/release-package-schema.json",
+        "en": f"{STANDARD_URL}{CURRENT_URL_TAG}/en/release-package-schema.json",
+        "es": f"{STANDARD_URL}{CURRENT_URL_TAG}/es/release-package-schema.json",
     },
     "records": {
-        "en": f"https://standard.open-contracting.org/{CURRENT_URL_TAG}/en/record-package-schema.json",
-        "es": f"https://standard.open-contracting.org/{CURRENT_URL_TAG}/es/record-package-schema.json",
+        "en": f"{STANDARD_URL}{CURRENT_URL_TAG}/en/record-package-schema.json",
+        "es": f"{STANDARD_URL}{CURRENT_URL_TAG}/es/record-package-schema.json",
     },
 }
@@ -1,16 +1,16 @@
 import logging
-from collections.abc import Mapping, Sequence
+from collections.abc import ItemsView, KeysView, Mapping, Sequence, ValuesView
 from dataclasses import dataclass, field, is_dataclass, replace
 
-from spoonbill.common import DEFAULT_FIELDS, DEFAULT_FIELDS_COMBINED
+from spoonbill.common import DEFAULT_FIELDS, DEFAULT_FIELDS_COMBINED, PREVIEW_ROWS
 from spoonbill.i18n import _
 from spoonbill.utils import (
     combine_path,
-    common_prefix,
     generate_table_name,
     get_path_for_array_col,
     get_pointer,
-    insert_after_key,
+    merge_ordered,
+    parse_path,
 )
 
 LOGGER = logging.getLogger("spoonbill")
@@ -35,6 +35,159 @@ class Column:
     hits: int = 0
     header: list = field(default_factory=list)
 
+    def merge(self, other):
+        """
+        Add the hits of the same column from another analysis.
+
+        :param other: A column with the same path
+        """
+        self.hits += other.hits
+
+
+class Columns(dict):
+    """
+    A dict of columns by path, in an order that supports inserting a column after another column in constant time.
+
+    The order is kept in a doubly-linked list, instead of in the dict's insertion order, so that neither inserting nor
+    deleting a column rebuilds the dict. Reads are as fast as a dict's.
+
+    ``version`` is incremented whenever a column is set, inserted or deleted, to tell cheaply whether the columns
+    changed.
+    """
+
+    def __init__(self, columns=()):
+        super().__init__()
+        self._previous = {}
+        self._next = {}
+        self._first = None
+        self._last = None
+        # The keys in order, computed when iterating and kept until a key is inserted or deleted.
+        self._order = []
+        self.version = 0
+        self.update(columns)
+
+    def __reduce__(self):
+        return type(self), (list(self.items()),)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({dict(self.items())!r})"
+
+    def __iter__(self):
+        if self._order is None:
+            order = []
+            key = self._first
+            while key is not None:
+                order.append(key)
+                key = self._next[key]
+            self._order = order
+        return iter(self._order)
+
+    def __reversed__(self):
+        return reversed(list(self))
+
+    def keys(self):
+        return KeysView(self)
+
+    def values(self):
+        return ValuesView(self)
+
+    def items(self):
+        return ItemsView(self)
+
+    def __setitem__(self, key, value):
+        if key not in self:
+            self._link(key, self._last)
+        super().__setitem__(key, value)
+        self.version += 1
+
+    def insert_after(self, after, key, value):
+        """
+        Insert a column after another column.
+
+        :param after: The key of the column after which to insert
+        :param key: The key of the column to insert, which mustn't be in the columns
+        :param value: The column to insert
+        """
+        if after not in self:
+            raise KeyError(after)
+        self._link(key, after)
+        super().__setitem__(key, value)
+        self.version += 1
+
+    def _link(self, key, previous):
+        following = self._first if previous is None else self._next[previous]
+        self._previous[key] = previous
+        self._next[key] = following
+        if previous is None:
+            self._first = key
+        else:
+            self._next[previous] = key
+        if following is None:
+            self._last = key
+        else:
+            self._previous[following] = key
+        if following is None and self._order is not None:
+            self._order.append(key)
+        else:
+            self._order = None
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        previous = self._previous.pop(key)
+        following = self._next.pop(key)
+        if previous is None:
+            self._first = following
+        else:
+            self._next[previous] = following
+        if following is None:
+            self._last = previous
+        else:
+            self._previous[following] = previous
+        self._order = None
+        self.version += 1
+
+    def pop(self, key, *default):
+        if key in self:
+            value = self[key]
+            del self[key]
+            return value
+        if default:
+            return default[0]
+        raise KeyError(key)
+
+    def popitem(self):
+        key = self._last
+        if key is None:
+            raise KeyError(key)
+        return key, self.pop(key)
+
+    def clear(self):
+        version = self.version
+        super().clear()
+        self.__init__()
+        self.version = version + 1
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def copy(self):
+        return type(self)(self.items())
+
+    def __or__(self, other):
+        columns = self.copy()
+        columns.update(other)
+        return columns
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
 
 @dataclass
 class Table:
@@ -58,6 +211,7 @@ class Table:
     :param types: All paths matched to this table with corresponding object type on each path
     :param preview_rows: Generated preview for split version of this table
     :param preview_rows_combined: Generated preview for unsplit version of this table
+    :param human_headers: Human-readable column headers by language, computed once and shared by writers
     """
 
     name: str
@@ -69,8 +223,8 @@ class Table:
     is_combined: bool = False
     splitted: bool = False
     rolled_up: bool = False
-    columns: Mapping[str, Column] = field(default_factory=dict)
-    combined_columns: Mapping[str, Column] = field(default_factory=dict)
+    columns: Mapping[str, Column] = field(default_factory=Columns)
+    combined_columns: Mapping[str, Column] = field(default_factory=Columns)
     additional_columns: Mapping[str, Column] = field(default_factory=dict)
     arrays: Mapping[str, int] = field(default_factory=dict)
     titles: Mapping[str, str] = field(default_factory=dict)
@@ -81,6 +235,7 @@ class Table:
 
     preview_rows: Sequence[dict] = field(default_factory=list)
     preview_rows_combined: Sequence[dict] = field(default_factory=list)
+    human_headers: Mapping[str, Mapping[str, str]] = field(default_factory=dict)
 
     def __post_init__(self):
         for attr in (
@@ -104,6 +259,16 @@ class Table:
                 if col not in self.combined_columns:
                     self.combined_columns[col] = column
                 self.titles[col] = col
+        for attr in ("columns", "combined_columns"):
+            if not isinstance(getattr(self, attr), Columns):
+                setattr(self, attr, Columns(getattr(self, attr)))
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        # Tables pickled before the columns were ordered by Columns hold dicts.
+        for attr in ("columns", "combined_columns"):
+            if not isinstance(getattr(self, attr), Columns):
+                setattr(self, attr, Columns(getattr(self, attr)))
 
     def _counter(self, split, cond):
         cols = self.columns if split else self.combined_columns
@@ -118,28 +283,45 @@ class Table:
         return self._counter(split, lambda c: c.hits > 0)
 
     def filter_columns(self, func):
-        self.columns = {col_id: col for col_id, col in self.columns.items() if not func(col)}
-        self.combined_columns = {col_id: col for col_id, col in self.combined_columns.items() if not func(col)}
+        for columns in (self.columns, self.combined_columns):
+            for col_id in [col_id for col_id, col in columns.items() if func(col)]:
+                del columns[col_id]
 
     def __iter__(self):
         yield from self.columns
 
+    def __contains__(self, path):
+        return path in self.columns
+
     def __getitem__(self, path):
         return self.columns.get(path)
 
+    def get_lineage(self):
+        """Return this table and its ancestors, up to its root table."""
+        lineage = [self]
+        table = self
+        while not table.is_root:
+            table = table.parent
+            lineage.append(table)
+        return lineage
+
     def add_array_column(self, col, path, abs_path, maximum):
-        array = self.is_array(path)
-        col_path = get_path_for_array_col(abs_path, array)
-        if self.arrays[array] > maximum:
-            return
-
-        if col_path not in self.combined_columns:
-            col = replace(col, path=col_path)
-            last_key = self.array_positions[array]
-            self.array_positions[array] = col_path
-            self.combined_columns = insert_after_key(self.combined_columns, {col_path: col}, last_key)
-        if not self.is_root:
-            self.parent.add_array_column(col, path, abs_path, maximum)
+        array = col_path = None
+        for table in self.get_lineage():
+            # The tables of a lineage usually share the array, and thus the column's path.
+            table_array = table.is_array(path)
+            if table_array != array:
+                array = table_array
+                col_path = get_path_for_array_col(abs_path, array)
+            if table.arrays[array] > maximum:
+                return
+
+            if col_path not in table.combined_columns:
+                col = replace(col, path=col_path, hits=0)
+                last_key = table.array_positions[array]
+                table.array_positions[array] = col_path
+                if last_key in table.combined_columns:
+                    table.combined_columns.insert_after(last_key, col_path, col)
 
     def add_column(self, path, item_type, title, *, propagated=False, additional=False, abs_path=None, header=""):
         """
@@ -153,38 +335,41 @@ class Table:
         :param additional: Mark this column as missing in schema
         :param abs_path: The column's full JSON path
         """
-        combined_path = combine_path(self, path)
-        col = Column(path, combined_path, title, item_type, header=header)
-        array = self.is_array(path)
-        if additional:
-            if array:
-                # when we analyzing file we need to keep index from data not to use 0
-                # e.g. /tender/items/166/relatedLot
-                combined_path = abs_path
-                col = replace(col, path=combined_path)
-            LOGGER.debug(_("Detected additional column: %s in %s table"), path, self.name)
-            self.additional_columns[combined_path] = col
-
-        if not propagated:
-            self.columns[combined_path] = col
-        self.combined_columns[combined_path] = col
-
-        if propagated:
-            self.array_columns[combined_path] = col
-            self.array_positions[array] = combined_path
-        if not self.is_root:
-            self.parent.add_column(path, item_type, title, propagated=True, header=header)
-        for p in (path, combined_path):
-            if path not in self.titles:
-                self.titles[p] = header
-        if path not in self.types:
-            self.types[path] = item_type
+        for table in self.get_lineage():
+            combined_path = combine_path(table, path)
+            col = Column(path, combined_path, title, item_type, header=header)
+            array = table.is_array(path)
+            if additional:
+                if array:
+                    # when we analyzing file we need to keep index from data not to use 0
+                    # e.g. /tender/items/166/relatedLot
+                    combined_path = abs_path
+                    col = replace(col, path=combined_path)
+                LOGGER.debug(_("Detected additional column: %s in %s table"), path, table.name)
+                table.additional_columns[combined_path] = col
+
+            if not propagated:
+                table.columns[combined_path] = col
+            table.combined_columns[combined_path] = col
+
+            if propagated:
+                table.array_columns[combined_path] = col
+                table.array_positions[array] = combined_path
+            for p in (path, combined_path):
+                if path not in table.titles:
+                    table.titles[p] = header
+            if path not in table.types:
+                table.types[path] = item_type
+            # The ancestors receive the column as propagated.
+            propagated = True
+            additional = False
 
     def is_array(self, path):
-        """Check whether the given path is in any table's arrays."""
-        for array in sorted(self.arrays, reverse=True):
-            if common_prefix(array, path) == array:
-                return array
+        """Return the innermost of the table's arrays that contains the given path, or False."""
+        arrays = self.arrays
+        for prefix in parse_path(path).prefixes:
+            if prefix in arrays:
+                return prefix
         return False
 
     def inc_column(self, abs_path, path):
@@ -194,16 +379,25 @@ class Table:
         :param abs_path: The column's full JSON path
         :param path: The column's JSON path without array indexes
         """
-        header = get_pointer(self, abs_path, path, split=True)
-        if header in self.combined_columns:
-            self.combined_columns[header].hits += 1
-        if not self.is_root:
-            self.parent.inc_column(abs_path, path)
+        for table, header in self.get_headers(abs_path, path):
+            if header in table.combined_columns:
+                table.combined_columns[header].hits += 1
+
+    def get_headers(self, abs_path, path):
+        """
+        Return the column to increment in this table and in each of its ancestors, for a non-empty cell.
+
+        The column might not exist, for example if its array is split.
+
+        :param abs_path: The column's full JSON path
+        :param path: The column's JSON path without array indexes
+        :return: A list of tables and column headers
+        """
+        return [(table, get_pointer(table, abs_path, path, split=True)) for table in self.get_lineage()]
 
     def add_array(self, header):
-        self.arrays[header] = 0
-        if not self.is_root:
-            self.parent.add_array(header)
+        for table in self.get_lineage():
+            table.arrays[header] = 0
 
     def set_array(self, header, item):
         """
@@ -213,14 +407,12 @@ class Table:
         :param item: Array from data
         :return: Whether the array is bigger than previously found and the length was updated
         """
-        count = self.arrays.get(header, 0)
         length = len(item)
-        if length > count:
-            self.arrays[header] = length
-            if not self.is_root:
-                return self.parent.set_array(header, item)
-            return True
-        return False
+        for table in self.get_lineage():
+            if length <= table.arrays.get(header, 0):
+                return False
+            table.arrays[header] = length
+        return True
 
     def inc(self):
         """Increment the number of rows in the table."""
@@ -229,13 +421,101 @@ class Table:
             self.inc_column(col_name, col_name)
 
     def set_preview_path(self, abs_path, path, value, max_items):
-        header = get_pointer(self, abs_path, path, split=True)
-        array = self.is_array(path)
-        self.preview_rows_combined[-1][header] = value
-        if header in self.combined_columns and (not array or (array and self.arrays[array] < max_items)):
-            self.preview_rows[-1][header] = value
-        if not self.is_root:
-            self.parent.set_preview_path(abs_path, path, value, max_items)
+        for table in self.get_lineage():
+            header = get_pointer(table, abs_path, path, split=True)
+            array = table.is_array(path)
+            table.preview_rows_combined[-1][header] = value
+            if header in table.combined_columns and (not array or (array and table.arrays[array] < max_items)):
+                table.preview_rows[-1][header] = value
+
+    def merge(self, other, preview_rows=PREVIEW_ROWS, schema_columns=None):
+        """
+        Merge the analysis of another table with the same name into this table.
+
+        Counters are summed, array lengths are maximized, and columns found only in ``other`` are added as if ``other``
+        analyzed its items after this table: the columns found in the data are appended, the columns of array items
+        beyond the first are inserted after the array's last column, and other columns are inserted after the column
+        that precedes them in ``other``. Splitting arrays that reach the threshold is left to the caller.
+
+        :param other: A table built from the same schema
+        :param preview_rows: The maximum number of preview rows to keep
+        :param schema_columns: The paths without array indexes of the columns parsed from the schema, in any table. If
+                               not set, the columns found in the data are the additional columns of ``other``.
+        """
+        self.total_rows += other.total_rows
+        self.splitted = self.splitted or other.splitted
+        self.rolled_up = self.rolled_up or other.rolled_up
+
+        def found(col_id):
+            if schema_columns is None:
+                return col_id in other.additional_columns
+            return parse_path(col_id).stripped not in schema_columns
+
+        for col_id, col in other.combined_columns.items():
+            if col_id in self.combined_columns:
+                self.combined_columns[col_id].merge(col)
+        # The columns of array items beyond the first are only in `combined_columns`.
+        inserted = {
+            col_id
+            for col_id in other.combined_columns
+            if col_id not in other.columns and col_id not in other.array_columns
+        }
+        appended = {
+            col_id
+            for col_id in other.combined_columns
+            if col_id not in inserted and col_id not in self.combined_columns and found(col_id)
+        }
+        theirs = {col_id: col for col_id, col in other.combined_columns.items() if col_id not in inserted}
+        combined_columns = Columns(merge_ordered(self.combined_columns, theirs, appended))
+        # Insert the columns of array items after the array's last column, like `add_array_column`.
+        positions = {}
+        previous = None
+        for col_id, col in other.combined_columns.items():
+            if col_id in inserted and col_id not in combined_columns:
+                array = other.is_array(parse_path(col_id).stripped)
+                after = positions.get(array, self.array_positions.get(array))
+                if after not in combined_columns:
+                    after = previous
+                if after is None:
+                    combined_columns[col_id] = col
+                else:
+                    combined_columns.insert_after(after, col_id, col)
+                positions[array] = col_id
+            elif col_id in appended and col_id in other.array_columns:
+                positions[other.is_array(parse_path(col_id).stripped)] = col_id
+            if col_id in combined_columns:
+                previous = col_id
+        self.combined_columns = combined_columns
+        # Keep the columns shared between mappings, as hits are only counted on `combined_columns`.
+        for attr in ("columns", "additional_columns", "array_columns"):
+            theirs = {col_id: self.combined_columns.get(col_id, col) for col_id, col in getattr(other, attr).items()}
+            appended = {col_id for col_id in theirs if found(col_id)}
+            setattr(self, attr, merge_ordered(getattr(self, attr), theirs, appended))
+        self.columns = Columns(self.columns)
+
+        for array, length in other.arrays.items():
+            self.arrays[array] = max(self.arrays.get(array, 0), length)
+        # The last column of each array is the last one added, in this table or then in `other`.
+        for array, col_id in other.array_positions.items():
+            if array in positions:
+                self.array_positions[array] = positions[array]
+            elif self.array_positions.get(array) not in self.combined_columns:
+                self.array_positions[array] = col_id
+
+        for attr in ("titles", "types"):
+            mapping = getattr(self, attr)
+            for key, value in getattr(other, attr).items():
+                mapping.setdefault(key, value)
+        for language, headers in other.human_headers.items():
+            mapping = self.human_headers.setdefault(language, {})
+            for key, value in headers.items():
+                mapping.setdefault(key, value)
+        for name in other.child_tables:
+            if name not in self.child_tables:
+                self.child_tables.append(name)
+        for attr in ("preview_rows", "preview_rows_combined"):
+            rows = getattr(self, attr)
+            rows.extend(getattr(other, attr)[: max(preview_rows - len(rows), 0)])
 
     def split(self, pointer):
         def drop(col):
@@ -1,28 +1,44 @@
 from __future__ import annotations
 
-import functools
+import hashlib
+import json
 import logging
+import os
 import pickle
 from collections import defaultdict, deque
 from pathlib import Path
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, NamedTuple
 
-import jsonref
 from flatten_dict import flatten
 
-from spoonbill.common import ARRAY, JOINABLE, JOINABLE_SEPARATOR, PREVIEW_ROWS, SEPARATOR, TABLE_THRESHOLD
+from spoonbill.common import (
+    ARRAY,
+    DEFAULT_FIELDS_COMBINED,
+    JOINABLE,
+    JOINABLE_SEPARATOR,
+    PREVIEW_ROWS,
+    SEPARATOR,
+    SHAPE_CACHE_SIZE,
+    TABLE_THRESHOLD,
+    TABLES_CACHE_VERSION,
+)
 from spoonbill.i18n import LOCALE, _
 from spoonbill.rowdata import Rows
 from spoonbill.spec import Table, add_child_table
 from spoonbill.utils import (
     PYTHON_TO_JSON_TYPE,
     RepeatFilter,
+    SchemaHeaderExtractor,
+    TableIndex,
     add_paths_to_schema,
     common_prefix,
     extract_type,
     generate_table_name,
-    get_matching_tables,
+    item_from_shape,
+    parse_path,
     resolve_file_uri,
+    resolve_refs,
+    schema_digest,
     validate_type,
 )
 
@@ -32,18 +48,95 @@ if TYPE_CHECKING:
 LOGGER = logging.getLogger("spoonbill")
 LOGGER.addFilter(RepeatFilter())
 
+JSON_TO_PYTHON_TYPE = {"object": dict, "array": list}
+
+
+class Dispatch(NamedTuple):
+    """How to analyze the values of a key in an object, which is the same for all objects at the same path."""
+
+    #: The path of the values, without array indexes
+    pointer: str
+    #: The table that the values belong to
+    table: Table
+    #: Whether each value is a new row in the table
+    new_row: bool
+    #: The expected type, or None if it's not known yet
+    item_type: list | str | None
+    #: The types of values that don't match the expected type
+    mismatched: frozenset
+    #: The paths of the column in a combined table, or None
+    combined: tuple[str, str] | None
+
+
+class PreviewCollector:
+    """
+    Collect the first rows of each table while analyzing, to preview the tables.
+
+    Subclass it to collect previews differently, and pass an instance to :class:`DataPreprocessor`.
+
+    :param rows: The number of rows to preview per table. Values are set from as many items.
+    """
+
+    def __init__(self, rows=PREVIEW_ROWS):
+        self.rows = rows
+
+    def add_row(self, table, rows, item_id, row_count):
+        """
+        Append a mostly-empty row to the previews of a table, unless it has enough rows.
+
+        This is important to do, because other code uses an index of -1 to access and update the current row.
+
+        :param table: The table
+        :param rows: The Rows object of the current item
+        :param item_id: Object id
+        :param row_count: The number of rows found in the table before this row
+        """
+        if row_count < self.rows:
+            for p_rows in table.preview_rows, table.preview_rows_combined:
+                p_rows.append(rows.new_row(table, item_id).as_dict())
+
+    def add_value(self, table, abs_path, path, value, max_items):
+        """
+        Set a value in the current preview rows of a table and its ancestors.
+
+        :param table: The table
+        :param abs_path: The column's full JSON path
+        :param path: The column's JSON path without array indexes
+        :param value: The value
+        :param max_items: The maximum array length, before an array is split
+        """
+        table.set_preview_path(abs_path, path, value, max_items)
+
+
+class _PreviewProbe(PreviewCollector):
+    """Record whether analyzing adds preview rows, without adding them."""
+
+    def __init__(self, rows):
+        super().__init__(rows)
+        self.added = False
+
+    def add_row(self, table, rows, item_id, row_count):  # noqa: ARG002
+        if row_count < self.rows:
+            self.added = True
+
 
 class DataPreprocessor:
     """
     Process the given schema and, based on this, extract information from the iterable dataset.
 
-    :param schema: The dataset's schema
+    Without a schema, only the root and combined tables are created, and the columns and child tables are inferred
+    from the dataset, as for the fields that are absent from a schema.
+
+    :param schema: The dataset's schema, or None to infer the tables from the dataset
     :param root_tables: The paths which should become root tables
     :param combined_tables: The paths which should become tables that combine data from different locations
     :param tables: Use these tables objects instead of parsing the schema
     :param table_threshold: The maximum array length, before it is recommended to split out a child table
     :param total_items: The total objects processed
     :param language: Language to use for the human-readable headings
+    :param tables_cache: A directory in which to cache the tables parsed from the schema, or None to not cache them
+    :param with_preview: Whether to collect previews of the tables
+    :param preview: The :class:`PreviewCollector` with which to collect previews, if ``with_preview`` is set
     """
 
     def __init__(
@@ -59,6 +152,8 @@ class DataPreprocessor:
         multiple_values=False,
         pkg_type=None,
         with_preview=True,
+        tables_cache=None,
+        preview=None,
     ):
         self.schema = schema
         self.root_tables = root_tables
@@ -68,18 +163,130 @@ class DataPreprocessor:
         self.multiple_values = multiple_values
 
         self.total_items = total_items
+        # The number of items analyzed, from which `total_items` is derived. An analysis of one item has the same
+        # `total_items` as an analysis of no items.
+        self._items = total_items + 1 if total_items else 0
         self.current_table = None
 
         self.language = language
         self.names_counter = defaultdict(int)
         self.with_preview = with_preview
+        self.preview = (preview or PreviewCollector()) if with_preview else None
+        self.tables_cache = tables_cache
+        # How to analyze the values of each key in each context, by the path and key of the object, and by key.
+        self.dispatch = {}
+        self.table_index = None
+        # The columns that each value increments, by the table, full path and path of the value.
+        self.headers = {}
+        # The number of rows and non-empty cells found in the current item, which are added to the tables at once.
+        self.pending_rows = defaultdict(int)
+        self.pending_hits = defaultdict(int)
+        # The number of each shape of items, and the rows and hits that analyzing an item of each shape adds by number,
+        # which are valid while the tables are as in shape_tables. See process_shapes.
+        self.shape_ids = {}
+        self.shape_counts = {}
+        self.shape_tables = None
+        # The paths without array indexes of the columns parsed from the schema, which keep their place when merging
+        # analyses, unlike the columns found in the data.
+        self.schema_columns = None
         if not self.tables:
             self.parse_schema()
+            self.schema_columns = {
+                parse_path(col_id).stripped for table in self.tables.values() for col_id in table.combined_columns
+            }
         self.pkg_type = pkg_type
 
     def __getitem__(self, table):
         return self.tables[table]
 
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # The dispatch table and table index are rebuilt while analyzing.
+        state["dispatch"] = {}
+        state["table_index"] = None
+        state["headers"] = {}
+        state["shape_ids"] = {}
+        state["shape_counts"] = {}
+        state["shape_tables"] = None
+        return state
+
+    def __setstate__(self, state):
+        state.setdefault("dispatch", {})
+        state.setdefault("table_index", None)
+        state.setdefault("headers", {})
+        state.setdefault("pending_rows", defaultdict(int))
+        state.setdefault("pending_hits", defaultdict(int))
+        state.setdefault("preview", PreviewCollector() if state.get("with_preview") else None)
+        state.setdefault("schema_columns", None)
+        state.setdefault("shape_ids", {})
+        state.setdefault("shape_counts", {})
+        state.setdefault("shape_tables", None)
+        total_items = state.get("total_items", 0)
+        state.setdefault("_items", total_items + 1 if total_items else 0)
+        self.__dict__.update(state)
+
+    def clear_dispatch(self):
+        """Clear the dispatch table and the columns that each value increments, after the tables change."""
+        for context in self.dispatch.values():
+            context.clear()
+        self.dispatch.clear()
+        # The pending hits were counted with the columns before the change.
+        self.flush_hits()
+        self.headers.clear()
+
+    def count_hit(self, abs_path, path):
+        """
+        Count a non-empty cell in the current table, to add to the table and its ancestors by :meth:`flush_hits`.
+
+        :param abs_path: The column's full JSON path
+        :param path: The column's JSON path without array indexes
+        """
+        key = (self.current_table.name, abs_path, path)
+        if key not in self.headers:
+            self.headers[key] = self.current_table.get_headers(abs_path, path)
+        self.pending_hits[key] += 1
+
+    def flush_hits(self):
+        """Add the rows and non-empty cells counted since the last flush to the tables."""
+        for name, count in self.pending_rows.items():
+            self.tables[name].total_rows += count
+            for col_name in DEFAULT_FIELDS_COMBINED:
+                key = (name, col_name, col_name)
+                if key not in self.headers:
+                    self.headers[key] = self.tables[name].get_headers(col_name, col_name)
+                self.pending_hits[key] += count
+        self.pending_rows.clear()
+        for key, count in self.pending_hits.items():
+            for table, header in self.headers[key]:
+                column = table.combined_columns.get(header)
+                if column is not None:
+                    column.hits += count
+        self.pending_hits.clear()
+
+    def compile_dispatch(self, path, parent_key, key, item):
+        """
+        Return how to analyze the values of a key in an object, or None if they don't belong to any table.
+
+        :param path: The path of the object, without array indexes
+        :param parent_key: The key of the object's context
+        :param key: The key
+        :param item: The first value of the key
+        :return: A :class:`Dispatch`, or None
+        """
+        pointer = self.join_path(path, key)
+        self.current_table = self.get_table(pointer)
+        if not self.current_table:
+            return None
+        self.extend_table_types(pointer, item)
+        item_type = self.current_table.types.get(pointer)
+        mismatched = frozenset()
+        if item_type and item_type != JOINABLE:
+            mismatched = frozenset(type_ for name, type_ in JSON_TO_PYTHON_TYPE.items() if name not in item_type)
+        combined = None
+        if self.current_table.is_combined:
+            combined = self.get_paths_for_combined_table(parent_key, key)
+        return Dispatch(pointer, self.current_table, self.is_new_row(pointer), item_type, mismatched, combined)
+
     def name_check(self, parent_key, key):
         table_name = generate_table_name(self.current_table.name, parent_key, key)
         self.names_counter[table_name] += 1
@@ -97,6 +304,7 @@ class DataPreprocessor:
         for name, path in tables.items():
             table = Table(name, path, is_root=True, is_combined=is_combined, parent="")
             self.tables[name] = table
+        self.table_index = None
 
     def is_base_table(self):
         return self.current_table.is_root or self.current_table.is_combined
@@ -107,8 +315,7 @@ class DataPreprocessor:
         if isinstance(self.schema, (str, Path)):
             self.schema = resolve_file_uri(self.schema)
         self.init_tables(self.root_tables)
-        if not isinstance(self.schema, jsonref.JsonRef):
-            self.schema = jsonref.JsonRef.replace_refs(self.schema)
+        self.schema = resolve_refs(self.schema)
         if self.combined_tables:
             self.init_tables(self.combined_tables, is_combined=True)
 
@@ -117,9 +324,83 @@ class DataPreprocessor:
         if self.combined_tables:
             self.init_tables(self.combined_tables, is_combined=True)
 
+    def tables_cache_path(self):
+        """
+        Return the path of the file in the tables cache for the configuration of this data preprocessor.
+
+        The file is named after a hash of the schema, the root and combined tables, the language and the threshold.
+
+        :return: A path, or None if the tables can't be cached
+        """
+        if not self.tables_cache:
+            return None
+        key = json.dumps(
+            [
+                TABLES_CACHE_VERSION,
+                schema_digest(self.schema),
+                self.root_tables,
+                self.combined_tables,
+                self.language,
+                self.table_threshold,
+            ],
+            sort_keys=True,
+        )
+        return Path(self.tables_cache) / hashlib.sha256(key.encode()).hexdigest()
+
+    def load_cached_tables(self, path):
+        """
+        Read the tables parsed from the schema from the tables cache.
+
+        :param path: The path returned by :meth:`tables_cache_path`
+        :return: Whether the tables were read
+        """
+        try:
+            with open(path, "rb") as fd:
+                self.tables, self.names_counter = pickle.load(fd)  # noqa: S301 # our data
+        except FileNotFoundError:
+            return False
+        except (OSError, EOFError, ValueError, pickle.UnpicklingError) as e:
+            LOGGER.warning(_("Ignoring invalid tables cache file {}: {}").format(path, e))
+            return False
+        self.clear_dispatch()
+        return True
+
+    def dump_cached_tables(self, path):
+        """
+        Write the tables parsed from the schema to the tables cache.
+
+        :param path: The path returned by :meth:`tables_cache_path`
+        """
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # Write atomically, in case of concurrent runs.
+            tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+            with open(tmp, "wb") as fd:
+                pickle.dump((self.tables, self.names_counter), fd)
+            tmp.replace(path)
+        except OSError as e:
+            LOGGER.warning(_("Can't cache tables in {}: {}").format(path, e))
+
     def parse_schema(self):
-        """Extract information from the schema."""
+        """
+        Extract information from the schema.
+
+        If a tables cache is set, the tables are read from it if they were parsed before, and written to it otherwise.
+        Without a schema, only the root and combined tables are created.
+        """
+        if self.schema is None:
+            self.prepare_tables()
+            return
         self.load_schema()
+        cache_path = self.tables_cache_path()
+        if cache_path and self.load_cached_tables(cache_path):
+            return
+        self.walk_schema()
+        if cache_path:
+            self.dump_cached_tables(cache_path)
+
+    def walk_schema(self):
+        """Create the tables and columns for the properties of the schema."""
         proxy = add_paths_to_schema(self.schema)
         to_analyze = deque([("", "", {}, proxy)])
 
@@ -136,8 +417,6 @@ class DataPreprocessor:
                     continue
                 if item.get("deprecated"):
                     continue
-                if hasattr(item, "__reference__") and item.__reference__.get("deprecated"):
-                    continue
 
                 typeset = extract_type(item)
                 pointer = self.join_path(path, key)
@@ -169,13 +448,22 @@ class DataPreprocessor:
                         pointer = SEPARATOR + self.join_path(parent_key, key)
                     self.current_table.add_column(pointer, typeset, pointer, header=item["$title"])
 
+    def resolve_headers(self):
+        """Compute the human-readable header of each column, to store it on the tables with the analysis."""
+        extractor = SchemaHeaderExtractor(self.schema, self.language)
+        for table in self.tables.values():
+            for column in {**table.combined_columns, **table.columns}:
+                extractor.get_table_header(table, column)
+
     def add_column(self, pointer, typeset):
         self.current_table.add_column(pointer, typeset, pointer)
 
     def _add_table(self, table, pointer):  # noqa: ARG002
         self.tables[table.name] = table
         self.current_table = table
-        self.get_table.cache_clear()
+        if self.table_index is not None:
+            self.table_index.add(table)
+        self.clear_dispatch()
 
     def add_additional_table(self, pointer, abs_pointer, parent_key, key, item):
         LOGGER.debug(_("Detected additional table: %s"), pointer)
@@ -196,7 +484,6 @@ class DataPreprocessor:
                         header=ppointer,
                     )
 
-    @functools.cache  # noqa: B019
     def get_table(self, path):
         """
         Get the table that best matches the given path.
@@ -204,30 +491,32 @@ class DataPreprocessor:
         :param path: A path
         :return: A table
         """
-        candidates = get_matching_tables(self.tables, path)
-        if not candidates:
-            return None
-        return candidates[0]
+        # The tables might be replaced, like when sorting them or reading them from the tables cache.
+        if self.table_index is None or self.table_index.tables is not self.tables:
+            self.table_index = TableIndex(self.tables)
+        return self.table_index.get(path)
 
     def add_preview_row(self, rows, item_id, parent_key):  # noqa: ARG002
         """
-        Append a mostly-empty row to the previews.
-
-        This is important to do, because other code uses an index of -1 to access and update the current row.
+        Append a mostly-empty row to the previews, if collecting previews.
 
         :param rows: The Rows object
         :param item_id: Object id
         """
         table = self.current_table
-        if self.with_preview and table.total_rows < PREVIEW_ROWS:
-            for p_rows in table.preview_rows, table.preview_rows_combined:
-                row = rows.new_row(table, item_id).as_dict()
-                p_rows.append(row)
+        if self.preview is not None:
+            self.preview.add_row(table, rows, item_id, table.total_rows + self.pending_rows[table.name])
 
     def inc_table_rows(self, item, rows, parent_key, record):
+        """
+        Count the rows of an object or array of objects in the current table.
+
+        :param rows: The Rows object, or None to not add preview rows
+        """
         for _noop in range(len(item) if isinstance(item, list) else 1):
-            self.current_table.inc()
-            self.add_preview_row(rows, record.get("id", ""), parent_key)
+            if rows is not None:
+                self.add_preview_row(rows, record.get("id", ""), parent_key)
+            self.pending_rows[self.current_table.name] += 1
 
     def is_new_row(self, pointer):
         # strict match like /parties, /tender
@@ -259,9 +548,7 @@ class DataPreprocessor:
             self.current_table.split(pointer)
 
     def is_array_col(self, abs_path):
-        chunks = abs_path.split(SEPARATOR)
-        path = self.join_path(*[p for p in chunks if not p.isdigit()])
-        return path in self.current_table
+        return parse_path(abs_path).stripped in self.current_table
 
     def clean_up_missing_arrays(self):
         def drop(col):
@@ -271,7 +558,7 @@ class DataPreprocessor:
         for table in self.tables.values():
             table.filter_columns(drop)
 
-    def process_items(self, releases, *, with_preview=True):  # noqa: ARG002
+    def process_items(self, releases, *, with_preview=True, start=0, clean_up=True):
         """
         Analyze releases.
 
@@ -279,120 +566,324 @@ class DataPreprocessor:
         versions of each table.
 
         :param releases: The releases to analyze
-        :param with_preview: Whether to generate previews for each table
-        """
-        count = 0
-        for count, release in enumerate(releases):
-            to_analyze = deque([("", "", "", {}, release)])
-            rows = Rows(ocid=release["ocid"], buyer=release.get("buyer", {}), data=defaultdict(list))
-            while to_analyze:
-                abs_path, path, parent_key, parent, record = to_analyze.popleft()
-                if hasattr(record, "items"):
-                    for key, item in record.items():
-                        pointer = self.join_path(path, key)
-
-                        self.current_table = self.get_table(pointer)
-                        if not self.current_table:
-                            continue
+        :param with_preview: Whether to generate previews for each table, if the data preprocessor collects previews
+        :param start: The index of the first release, if continuing the analysis of a file
+        :param clean_up: Whether to drop the array columns without hits afterwards, once the file is analyzed
+        """
+        preview = self.preview if with_preview else None
+        items = start
+        for count, release in enumerate(releases, start):
+            if preview is None:
+                rows = None
+            else:
+                rows = Rows(ocid=release["ocid"], buyer=release.get("buyer", {}), data=defaultdict(list))
+            # Set values in the previews from the first items only.
+            values = preview if preview is not None and count < preview.rows else None
+            self._analyze_item(release, rows, values)
+            self.flush_hits()
+            items = count + 1
+            yield count
+        if clean_up:
+            self.clean_up_missing_arrays()
+        self._items = items
+        self.total_items = max(items - 1, 0)
 
-                        if self.is_new_row(pointer):
-                            self.inc_table_rows(item, rows, parent_key, record)
+    def _analyze_item(self, release, rows, values):
+        """
+        Analyze a release, without adding its rows and hits to the tables.
 
-                        self.extend_table_types(pointer, item)
+        :param release: The release
+        :param rows: The Rows object of the release, or None to not add preview rows
+        :param values: The :class:`PreviewCollector` with which to set values in the previews, or None
+        """
+        to_analyze = deque([("", "", "", {}, release)])
+        while to_analyze:
+            abs_path, path, parent_key, parent, record = to_analyze.popleft()
+            if hasattr(record, "items"):
+                context = self.dispatch.get((path, parent_key))
+                if context is None:
+                    context = self.dispatch[(path, parent_key)] = {}
+                for key, item in record.items():
+                    dispatch = context.get(key)
+                    if dispatch is None:
+                        dispatch = self.compile_dispatch(path, parent_key, key, item) or False
+                        # Analyzing a previous key might have added a table, which clears the dispatch table.
+                        self.dispatch[(path, parent_key)] = context
+                        context[key] = dispatch
+                    if not dispatch:
+                        continue
+                    pointer = dispatch.pointer
+                    self.current_table = dispatch.table
+
+                    if dispatch.new_row:
+                        self.inc_table_rows(item, rows, parent_key, record)
+
+                    item_type = dispatch.item_type
+                    if item_type is None:
+                        # The type is set once a value is analyzed, like for additional columns.
                         item_type = self.current_table.types.get(pointer)
-
                         if not self.is_type_matched(pointer, item, item_type):
                             continue
-
-                        if isinstance(item, dict):
-                            to_analyze.append(
-                                (
-                                    self.join_path(abs_path, key),
-                                    pointer,
-                                    key,
-                                    record,
-                                    item,
-                                )
+                    elif type(item) in dispatch.mismatched:
+                        LOGGER.error("Mismatched type on %s expected %s", pointer, item_type)
+                        continue
+
+                    if isinstance(item, dict):
+                        to_analyze.append(
+                            (
+                                self.join_path(abs_path, key),
+                                pointer,
+                                key,
+                                record,
+                                item,
                             )
-                        elif item and isinstance(item, list):
-                            abs_pointer = self.join_path(abs_path, key)
+                        )
+                    elif item and isinstance(item, list):
+                        abs_pointer = self.join_path(abs_path, key)
 
-                            if not isinstance(item[0], dict) and not item_type:
-                                item_type = JOINABLE
-                                self.add_joinable_column(abs_pointer, pointer)
+                        if not isinstance(item[0], dict) and not item_type:
+                            item_type = JOINABLE
+                            self.add_joinable_column(abs_pointer, pointer)
 
-                            if item_type == JOINABLE:
-                                if pointer not in self.current_table:
-                                    self.add_joinable_column(abs_pointer, pointer)
-                                self.current_table.inc_column(abs_pointer, pointer)
-                                if self.with_preview and count < PREVIEW_ROWS:
-                                    value = JOINABLE_SEPARATOR.join([str(i) for i in item])
-                                    self.current_table.set_preview_path(
-                                        abs_pointer, pointer, value, self.table_threshold
+                        if item_type == JOINABLE:
+                            if pointer not in self.current_table:
+                                self.add_joinable_column(abs_pointer, pointer)
+                            self.count_hit(abs_pointer, pointer)
+                            if values is not None:
+                                value = JOINABLE_SEPARATOR.join([str(i) for i in item])
+                                values.add_value(self.current_table, abs_pointer, pointer, value, self.table_threshold)
+                        elif self.is_base_table() and (
+                            # Without a schema, arrays of objects in root tables become child tables.
+                            self.schema is not None
+                            or self.current_table.is_combined
+                            or pointer in self.current_table.path
+                        ):
+                            for value in item:
+                                to_analyze.append(
+                                    (
+                                        abs_pointer,
+                                        pointer,
+                                        key,
+                                        record,
+                                        value,
                                     )
-                            elif self.is_base_table():
-                                for value in item:
+                                )
+                        else:
+                            parent_table = (
+                                self.current_table if self.current_table.is_root else self.current_table.parent
+                            )
+                            if pointer not in parent_table.arrays:
+                                LOGGER.debug(_("Detected additional table: %s"), pointer)
+                                self.current_table.types[pointer] = ["array"]
+                                parent_table = self.current_table
+                                self.add_additional_table(pointer, abs_pointer, parent_key, key, item)
+                                self.inc_table_rows(item, rows, parent_key, record)
+
+                            if parent_table.set_array(pointer, item):
+                                self.handle_array_expanded(pointer, item, abs_path, key)
+
+                            for i, value in enumerate(item):
+                                if isinstance(value, dict):
+                                    abs_pointer = self.join_path(abs_path, key, str(i))
                                     to_analyze.append(
                                         (
                                             abs_pointer,
                                             pointer,
-                                            key,
+                                            parent_key,
                                             record,
                                             value,
                                         )
                                     )
-                            else:
-                                parent_table = self.current_table.parent
-                                if pointer not in parent_table.arrays:
-                                    LOGGER.debug(_("Detected additional table: %s"), pointer)
-                                    self.current_table.types[pointer] = ["array"]
-                                    parent_table = self.current_table
-                                    self.add_additional_table(pointer, abs_pointer, parent_key, key, item)
-                                    self.add_preview_row(rows, record.get("id", ""), parent_key)
-
-                                if parent_table.set_array(pointer, item):
-                                    self.handle_array_expanded(pointer, item, abs_path, key)
-
-                                for i, value in enumerate(item):
-                                    if isinstance(value, dict):
-                                        abs_pointer = self.join_path(abs_path, key, str(i))
-                                        to_analyze.append(
-                                            (
-                                                abs_pointer,
-                                                pointer,
-                                                parent_key,
-                                                record,
-                                                value,
-                                            )
-                                        )
+                    else:
+                        abs_pointer = self.join_path(abs_path, key)
+                        if dispatch.combined:
+                            pointer, abs_pointer = dispatch.combined
+                        col = self.current_table.columns.get(pointer)
+                        if col:
+                            if abs_pointer not in self.current_table:
+                                parent = self.current_table.parent
+                                parent.add_array_column(col, pointer, abs_pointer, self.table_threshold)
                         else:
-                            abs_pointer = self.join_path(abs_path, key)
-                            if self.current_table.is_combined:
-                                pointer, abs_pointer = self.get_paths_for_combined_table(parent_key, key)
-                            col = self.current_table.columns.get(pointer)
-                            if col:
-                                if abs_pointer not in self.current_table:
-                                    parent = self.current_table.parent
-                                    parent.add_array_column(col, pointer, abs_pointer, self.table_threshold)
-                            else:
-                                self.current_table.add_column(
-                                    pointer,
-                                    self.guess_type(item),
-                                    pointer,
-                                    additional=True,
-                                    abs_path=abs_pointer,
-                                )
-                            self.current_table.inc_column(abs_pointer, pointer)
-                            if (
-                                item
-                                and self.with_preview
-                                and count < PREVIEW_ROWS
-                                and not pointer.startswith("/buyer")
-                            ):
-                                self.current_table.set_preview_path(abs_pointer, pointer, item, self.table_threshold)
-            yield count
+                            self.current_table.add_column(
+                                pointer,
+                                self.guess_type(item),
+                                pointer,
+                                additional=True,
+                                abs_path=abs_pointer,
+                            )
+                        self.count_hit(abs_pointer, pointer)
+                        if values is not None and item and not pointer.startswith("/buyer"):
+                            values.add_value(self.current_table, abs_pointer, pointer, item, self.table_threshold)
+
+    def process_shapes(self, shapes, sequence, *, start=0, releases=None):
+        """
+        Analyze releases from their shapes, returned by :func:`spoonbill.utils.get_shape`.
+
+        Analyzing releases of the same shape has the same result, except for previews. A release of each shape is
+        analyzed, and the rows and hits that it adds are added again for each later release of that shape, until the
+        tables change. Preview rows are expected to be added to the first rows of each table, as by
+        :class:`PreviewCollector`, and no values are set in the previews.
+
+        :param shapes: The distinct shapes of the releases
+        :param sequence: The index in ``shapes`` of the shape of each release, in order
+        :param start: The index of the first release, if continuing the analysis of a file
+        :param releases: If collecting previews, the releases that might add preview rows, by index in ``sequence``,
+                         which are analyzed instead of their shapes
+        :return: Whether the releases were analyzed. If not, because another release adds preview rows, nothing
+                 changes.
+        """
+        if len(self.shape_ids) > SHAPE_CACHE_SIZE:
+            self.shape_ids.clear()
+            self.shape_counts.clear()
+        ids = [self.shape_ids.setdefault(shape, len(self.shape_ids)) for shape in shapes]
+        tables = self._get_structure()
+        if tables != self.shape_tables:
+            self.shape_counts.clear()
+        preview = self.preview
+        probe = None
+        if releases is not None and preview is not None:
+            probe = _PreviewProbe(preview.rows)
+            # The probe doesn't use the Rows object.
+            probe_rows = Rows(ocid="", buyer={}, data=defaultdict(list))
+            snapshot = pickle.dumps(self.tables, protocol=pickle.HIGHEST_PROTOCOL)
+        releases = releases or {}
+
+        shape_counts = self.shape_counts
+        # The number of releases of each shape whose rows and hits are still to add.
+        pending = defaultdict(int)
+        try:
+            for position, index in enumerate(sequence):
+                shape_id = ids[index]
+                release = releases.get(position)
+                if release is None:
+                    if shape_id in shape_counts:
+                        pending[shape_id] += 1
+                        continue
+                    release = item_from_shape(shapes[index])
+                    rows = probe_rows if probe else None
+                    self.preview = probe
+                else:
+                    rows = Rows(ocid=release["ocid"], buyer=release.get("buyer", {}), data=defaultdict(list))
+                    self.preview = preview
+                # Add the pending rows and hits before the tables might change.
+                self._add_shape_counts(pending)
+                self._analyze_item(release, rows, None)
+                if probe and probe.added:
+                    self.tables = pickle.loads(snapshot)  # noqa: S301 # our data
+                    self.pending_rows.clear()
+                    self.pending_hits.clear()
+                    self.shape_counts.clear()
+                    self.shape_tables = None
+                    self.clear_dispatch()
+                    return False
+                counts = (dict(self.pending_rows), dict(self.pending_hits))
+                self.flush_hits()
+                structure = self._get_structure()
+                if structure != tables:
+                    shape_counts.clear()
+                    tables = structure
+                # The releases of a shape that adds rows to a table with too few rows might add preview rows.
+                elif not probe or all(self.tables[name].total_rows >= probe.rows for name in counts[0]):
+                    shape_counts[shape_id] = counts
+            self._add_shape_counts(pending)
+        finally:
+            self.preview = preview
+        self.shape_tables = tables
+        self._items = start + len(sequence)
+        self.total_items = max(self._items - 1, 0)
+        return True
+
+    def _add_shape_counts(self, pending):
+        """Add the rows and hits of the releases counted by shape, and reset the counts."""
+        for shape_id, releases in pending.items():
+            rows, hits = self.shape_counts[shape_id]
+            for name, count in rows.items():
+                self.pending_rows[name] += count * releases
+            for key, count in hits.items():
+                self.pending_hits[key] += count * releases
+        pending.clear()
+        self.flush_hits()
+
+    def _get_structure(self):
+        """
+        Return what analyzing a release depends on, other than the release: the tables, except for their row counts,
+        hits and previews.
+
+        The columns are compared by version, so that the result is cheap to compare.
+        """
+        return [
+            (
+                id(table.columns),
+                table.columns.version,
+                id(table.combined_columns),
+                table.combined_columns.version,
+                len(table.additional_columns),
+                len(table.array_columns),
+                len(table.arrays),
+                sum(table.arrays.values()),
+                tuple(table.array_positions.items()),
+                len(table.types),
+                len(table.child_tables),
+                table.splitted,
+                table.rolled_up,
+            )
+            for table in self.tables.values()
+        ]
+
+    def merge(self, other):
+        """
+        Merge the analysis of another data preprocessor into this one.
+
+        Both data preprocessors must be built from the same schema, with the same root tables, combined tables and
+        threshold. Row counts and hits are summed, the maximum array lengths are kept, and the columns and child tables
+        found only in ``other`` are added in the order in which analyzing the items of ``other`` after those of this
+        data preprocessor adds them. Arrays that reach the threshold in one analysis only are split in the other
+        analysis before merging, so that the columns added after an array is split are kept.
+
+        The tables of ``other`` might be reused, so ``other`` should not be used afterwards.
+
+        :param other: A data preprocessor that analyzed different items
+        """
+        if other is self:
+            raise ValueError(_("Can't merge an analysis with itself"))
+        if (
+            other.root_tables != self.root_tables
+            or other.combined_tables != self.combined_tables
+            or other.table_threshold != self.table_threshold
+            or (other.schema is not self.schema and other.schema != self.schema)
+        ):
+            raise ValueError(_("Can't merge analyses with different schemas, tables or thresholds"))
+
+        # Analyzing the items of `other` after those of this data preprocessor splits the arrays that reach the
+        # threshold in `other` only, dropping their columns from this data preprocessor's tables. The arrays that
+        # exceed the threshold in this data preprocessor only get no columns from the items of `other`. The arrays
+        # that reach the threshold in both are already split in both.
+        for name, table in self.tables.items():
+            other_table = other.tables.get(name)
+            if other_table is None or table.is_root or table.is_combined:
+                continue
+            for pointer in table.path:
+                length = table.parent.arrays.get(pointer, 0)
+                other_length = other_table.parent.arrays.get(pointer, 0)
+                if length < self.table_threshold <= other_length:
+                    table.split(pointer)
+                elif other_length < self.table_threshold < length:
+                    other_table.split(pointer)
+
+        preview_rows = self.preview.rows if self.preview else PREVIEW_ROWS
+        schema_columns = self.schema_columns if self.schema_columns is not None else other.schema_columns
+        for name, table in other.tables.items():
+            if name in self.tables:
+                self.tables[name].merge(table, preview_rows=preview_rows, schema_columns=schema_columns)
+            else:
+                if table.parent:
+                    table.parent = self.tables[table.parent.name]
+                self.tables[name] = table
+        self.table_index = None
+        self.clear_dispatch()
         self.clean_up_missing_arrays()
-        self.total_items = count
+        self._items += other._items  # noqa: SLF001 # same class
+        self.total_items = max(self._items - 1, 0)
 
     def dump(self, path):
         """
@@ -1,21 +1,57 @@
+import bz2
 import copy
 import functools
 import gzip
+import hashlib
+import io
 import json
 import logging
+import lzma
+import os
+import pickle
+import queue
 import re
+import struct
+import sys
+import tempfile
+import threading
+import time
+import zipfile
 from collections import OrderedDict
-from itertools import chain
+from itertools import chain, pairwise
 from numbers import Number
 from pathlib import Path
+from typing import NamedTuple
+from urllib.parse import unquote, urldefrag, urljoin, urlsplit
 
 import ijson
 import jsonref
 import requests
-from scalpl import Cut
-
-from spoonbill.common import COMBINED_TABLES, SEPARATOR
-
+from ocdsextensionregistry import ProfileBuilder
+
+try:
+    from compression import zstd  # Python 3.14+
+except ImportError:
+    try:
+        import zstandard as zstd
+    except ImportError:
+        zstd = None
+
+from spoonbill.common import (
+    CACHE_DIR,
+    COMBINED_TABLES,
+    PATH_CACHE_SIZE,
+    PROGRESS_INTERVAL,
+    READ_AHEAD_BLOCK_SIZE,
+    READ_AHEAD_BLOCKS,
+    REWIND_BUFFER_SIZE,
+    SEPARATOR,
+    STANDARD_URL,
+)
+from spoonbill.i18n import LOCALE, _
+
+# A path segment that is an array index other than 0, e.g. "/1" in "/tender/items/1/id".
+ARRAY_INDEX = re.compile(r"(?<=/)0*[1-9][0-9]*(?=/|$)")
 PYTHON_TO_JSON_TYPE = {
     "list": "array",
     "dict": "object",
@@ -36,7 +72,68 @@ ABBREVIATION_TABLE_NAME = {
     "contracts_implementation_transactions": "transactions",
 }
 
+# Copies of the files published at STANDARD_URL, at the same paths.
+SCHEMA_DIR = Path(__file__).parent / "schema"
 GZIP_MAGIC_NUMBER = (b"\x1f", b"\x8b")
+BZ2_MAGIC_NUMBER = b"BZh"
+XZ_MAGIC_NUMBER = b"\xfd7zXZ\x00"
+ZSTD_MAGIC_NUMBER = b"\x28\xb5\x2f\xfd"
+MAGIC_NUMBER_LENGTH = len(XZ_MAGIC_NUMBER)
+# The start of an item cache, which is followed by the byte of its compression and the frames of its items. The
+# compression is recorded, not sniffed, as the first frame's length can start like a magic number.
+ITEMS_MAGIC_NUMBER = b"SPOONBILL-ITEMS"
+ITEMS_UNCOMPRESSED = b"\x00"
+ITEMS_GZIP = b"\x01"
+# The length of each pickled item in an item cache.
+FRAME_HEADER = struct.Struct("<I")
+
+
+class ParsedPath(NamedTuple):
+    """The parts of a path, which are derived once per distinct path by :func:`parse_path`."""
+
+    #: The path, interned
+    path: str
+    #: The path's segments, starting with an empty segment
+    segments: tuple[str, ...]
+    #: The positions of the segments that are array indexes
+    indexes: tuple[int, ...]
+    #: The path without its array indexes, interned
+    stripped: str
+    #: The path and its parent paths, from the longest to the shortest, without the empty path
+    prefixes: tuple[str, ...]
+
+
+@functools.lru_cache(maxsize=PATH_CACHE_SIZE)
+def parse_path(path):
+    """
+    Split a path into its segments, and find its array indexes.
+
+    >>> parsed = parse_path('/tender/items/12/id')
+    >>> parsed.segments, parsed.indexes, parsed.stripped
+    (('', 'tender', 'items', '12', 'id'), (3,), '/tender/items/id')
+    >>> parse_path('/tender/items/id').prefixes
+    ('/tender/items/id', '/tender/items', '/tender')
+    """
+    segments = tuple(path.split(SEPARATOR))
+    indexes = tuple(i for i, segment in enumerate(segments) if segment.isdigit())
+    stripped = SEPARATOR.join(segment for i, segment in enumerate(segments) if i not in indexes)
+    prefixes = tuple(SEPARATOR.join(segments[:i]) for i in range(len(segments), 1, -1))
+    return ParsedPath(sys.intern(path), segments, indexes, sys.intern(stripped), prefixes)
+
+
+def get_enclosing_arrays(arrays, path):
+    """
+    Return the arrays that contain the given path, from the innermost to the outermost.
+
+    The lookup takes time proportional to the path's depth, not to the number of arrays.
+
+    :param arrays: The paths of arrays, like the keys of :attr:`spoonbill.spec.Table.arrays`
+    :param path: A path without array indexes
+
+    >>> get_enclosing_arrays({'/tender/items': 0, '/tender/items/additionalClassifications': 0}, '/tender/items/id')
+    ['/tender/items']
+    """
+    return [prefix for prefix in parse_path(path).prefixes if prefix in arrays]
 
 
 @functools.cache
@@ -66,13 +163,43 @@ def common_prefix(a, b, separator="/"):
     return separator.join(common)
 
 
-def iter_file(fd, root, *, multiple_values=False):
+@functools.cache
+def get_ijson_backend(name="auto"):
+    """
+    Return the ijson backend with the given name, and log which backend is active.
+
+    If ``name`` is "auto", ijson's fastest available backend is used, and a warning is logged if it is the pure-Python
+    backend.
+
+    :param name: "auto" or the name of an ijson backend
+    :raises ValueError: if the backend is not available
+
+    >>> get_ijson_backend('python').backend_name
+    'python'
+    """
+    if name == "auto":
+        backend = ijson.get_backend(ijson.backend)
+        if backend.backend_name == "python":
+            LOGGER.warning(
+                _("Using the pure-Python ijson backend, which is slow. Install yajl to use a faster backend")
+            )
+    else:
+        try:
+            backend = ijson.get_backend(name)
+        except ImportError as e:
+            raise ValueError(_("ijson backend {} is not available: {}").format(name, e)) from e
+    LOGGER.info(_("Using ijson backend: {}").format(backend.backend_name))
+    return backend
+
+
+def iter_file(fd, root, *, multiple_values=False, backend="auto"):
     """
     Iterate over ``root`` array in file provided by ``filename`` using ijson.
 
     :param fd: File descriptor
     :param str root: Array field name inside file
     :param bool multiple_values: Determine line-delimited JSON
+    :param str backend: The ijson backend to use, or "auto"
     :return: Iterator of bytes read and item as a tuple
 
     >>> with open('tests/data/ocds-sample-data.json', 'rb') as f:
@@ -82,10 +209,95 @@ def iter_file(fd, root, *, multiple_values=False):
     ...     len([r for r in iter_file(f, 'releases')])
     6
     """
-    reader = ijson.items(fd, prefix=("" if multiple_values else f"{root}.item"), multiple_values=multiple_values)
+    reader = get_ijson_backend(backend).items(
+        fd, prefix=("" if multiple_values else f"{root}.item"), multiple_values=multiple_values
+    )
     yield from reader
 
 
+def get_package_extensions(fd, *, backend="auto"):
+    """
+    Return the URLs of the extensions that a package declares before its releases or records.
+
+    The file is read only until the releases or records, so that the extensions are read cheaply, and extensions that
+    are declared after the releases or records are ignored.
+
+    :param fd: File descriptor of a package
+    :param str backend: The ijson backend to use, or "auto"
+    :return: A list of URLs
+
+    >>> import io
+    >>> get_package_extensions(io.BytesIO(b'{"extensions": ["https://example.com/extension.json"], "releases": []}'))
+    ['https://example.com/extension.json']
+    """
+    extensions = []
+    for prefix, event, value in get_ijson_backend(backend).parse(fd):
+        if prefix == "extensions.item" and event == "string":
+            extensions.append(value)
+        elif not prefix and (event == "end_map" or (event == "map_key" and value in {"releases", "records"})):
+            break
+    return extensions
+
+
+def open_items_writer(fd, *, compress=False):
+    """
+    Write the header of an item cache to a binary file, and return the file-like object to which to write its items.
+
+    :param fd: File descriptor opened for binary writing
+    :param compress: Whether to compress the items with gzip
+    :return: ``fd``, or a ``gzip.GzipFile`` that writes to ``fd`` and that must be closed to write the gzip trailer
+    """
+    fd.write(ITEMS_MAGIC_NUMBER)
+    if compress:
+        fd.write(ITEMS_GZIP)
+        return gzip.GzipFile(fileobj=fd, mode="wb", compresslevel=1)
+    fd.write(ITEMS_UNCOMPRESSED)
+    return fd
+
+
+def open_items(fd):
+    """
+    Read the header of an item cache written by :func:`open_items_writer`, and return the file-like object from which
+    to read its items.
+
+    :param fd: File descriptor opened for binary reading, at the start of the item cache
+    :raises ValueError: if the file isn't an item cache
+    """
+    header = fd.read(len(ITEMS_MAGIC_NUMBER) + 1)
+    if header == ITEMS_MAGIC_NUMBER + ITEMS_UNCOMPRESSED:
+        return fd
+    if header == ITEMS_MAGIC_NUMBER + ITEMS_GZIP:
+        return gzip.GzipFile(fileobj=fd, mode="rb")
+    raise ValueError(_("{} isn't a cache of parsed items").format(getattr(fd, "name", "")))
+
+
+def dump_items(items, fd):
+    """
+    Write each item to a binary file as a length-prefixed pickle frame, while iterating over the items.
+
+    :param items: Iterable of items
+    :param fd: File descriptor opened for binary writing, like the one returned by :func:`open_items_writer`
+    :return: Iterator of items
+    """
+    for item in items:
+        data = pickle.dumps(item, protocol=pickle.HIGHEST_PROTOCOL)
+        fd.write(FRAME_HEADER.pack(len(data)))
+        fd.write(data)
+        yield item
+
+
+def load_items(fd):
+    """
+    Iterate over the items written to a binary file by :func:`dump_items`.
+
+    :param fd: File descriptor opened for binary reading, like the one returned by :func:`open_items`
+    :return: Iterator of items
+    """
+    while header := fd.read(FRAME_HEADER.size):
+        (size,) = FRAME_HEADER.unpack(header)
+        yield pickle.loads(fd.read(size))  # noqa: S301 # our data
+
+
 def extract_type(item):
     """
     Extract item possible types from jsonschema definition.
@@ -143,10 +355,9 @@ def get_root(table):
 def combine_path(root, path, index="0", separator="/"):
     """Generate index based header for combined column."""
     combined_path = path
-    for array in sorted(root.arrays, reverse=True):
-        if common_prefix(path, array) == array:
-            chunk = separator.join((array, index))
-            combined_path = combined_path.replace(array, chunk)
+    for array in get_enclosing_arrays(root.arrays, path):
+        chunk = separator.join((array, index))
+        combined_path = combined_path.replace(array, chunk)
     return combined_path
 
 
@@ -167,6 +378,58 @@ def get_matching_tables(tables, path):
     return sorted(candidates, key=lambda c: max(len(p) for p in c.path), reverse=True)
 
 
+class TableIndex:
+    """
+    Trie of the segments of the tables' paths, to get the table that best matches a path in time proportional to the
+    path's depth.
+
+    The best match is the same as the first table returned by :func:`get_matching_tables`.
+
+    :param tables: The tables, by name. Tables added to the mapping later must be added to the index.
+    """
+
+    def __init__(self, tables):
+        self.tables = tables
+        self.root = {}
+        self.count = 0
+        for table in tables.values():
+            self.add(table)
+
+    def add(self, table):
+        """
+        Index a table that isn't indexed yet.
+
+        :param table: The table
+        """
+        # Prefer the tables with the longest path, then the tables added first, like get_matching_tables.
+        entry = (-max(len(p) for p in table.path), self.count, table)
+        self.count += 1
+        for path in table.path:
+            node = self.root
+            for segment in path.split(SEPARATOR):
+                node = node.setdefault(segment, {})
+            # The segments are strings, so None can't collide with a child node.
+            node.setdefault(None, []).append(entry)
+
+    def get(self, path):
+        """
+        Get the table that best matches the given path.
+
+        :param path: A path
+        :return: A table, or None
+        """
+        best = None
+        node = self.root
+        for segment in path.split(SEPARATOR):
+            node = node.get(segment)
+            if node is None:
+                break
+            for entry in node.get(None, ()):
+                if best is None or entry < best:
+                    best = entry
+        return best and best[2]
+
+
 def generate_table_name(parent_table, parent_key, key):
     """
     Generate name for non root table, to be used as sheet name.
@@ -201,32 +464,251 @@ def generate_table_name(parent_table, parent_key, key):
     return table_name
 
 
-def insert_after_key(columns, insert, last_key):
+def merge_ordered(target, source, appended=()):
+    """
+    Add the keys of ``source`` missing in ``target``, in the order in which adding the keys of both in turn does.
+
+    The keys in ``appended`` are appended in source order, as their keys in ``target`` were found first. Other keys
+    are added after the closest preceding key they share, and after the keys only in ``target`` that follow it.
+
+    >>> merge_ordered({'a': 1, 'c': 3}, {'a': 0, 'b': 2, 'c': 0, 'd': 4})
+    {'a': 1, 'b': 2, 'c': 3, 'd': 4}
+    >>> merge_ordered({'a': 1, 'x': 9, 'c': 3}, {'a': 0, 'b': 2, 'c': 0})
+    {'a': 1, 'x': 9, 'b': 2, 'c': 3}
+    >>> merge_ordered({'b': 2}, {'a': 1, 'b': 0})
+    {'a': 1, 'b': 2}
+    >>> merge_ordered({'a': 1, 'x': 9}, {'a': 0, 'b': 2, 'x': 0}, appended={'b', 'x'})
+    {'a': 1, 'x': 9, 'b': 2}
+    """
+    target = {**target, **{key: val for key, val in source.items() if key in appended and key not in target}}
+    pending = {}
+    anchor = None
+    for key, val in source.items():
+        if key in target:
+            anchor = key
+        else:
+            pending.setdefault(anchor, {})[key] = val
+    if not pending:
+        return target
     data = {}
-    for key, val in columns.items():
+    waiting = pending.get(None)
+    for key, val in target.items():
+        if waiting and key in source:
+            data.update(waiting)
+            waiting = None
         data[key] = val
-        if key == last_key:
-            data.update(insert)
+        if key in pending:
+            waiting = pending[key]
+    if waiting:
+        data.update(waiting)
     return data
 
 
+def fetch(url, cache_dir=CACHE_DIR):
+    """
+    Return the content at a URL, from the bundled schemas, from the local cache or from the network.
+
+    The cache is content-addressed: each content is stored once, in a file named after its SHA-256 hash, and each URL
+    is mapped to the hash of its content. Cached files are verified against their hash before use.
+
+    :param url: The URL
+    :param cache_dir: The directory of the cache
+    :return: The content as bytes
+    """
+    if url.startswith(STANDARD_URL):
+        path = (SCHEMA_DIR / url[len(STANDARD_URL) :]).resolve()
+        # Don't read outside the bundled schemas, e.g. if the URL's path has ".." segments or starts with "/".
+        if path.is_relative_to(SCHEMA_DIR.resolve()) and path.is_file():
+            return path.read_bytes()
+
+    key = cache_dir / "urls" / hashlib.sha256(url.encode()).hexdigest()
+    if key.is_file():
+        digest = key.read_text()
+        path = cache_dir / "objects" / digest
+        if path.is_file():
+            content = path.read_bytes()
+            if hashlib.sha256(content).hexdigest() == digest:
+                return content
+
+    response = requests.get(url, timeout=10)
+    response.raise_for_status()
+    content = response.content
+    digest = hashlib.sha256(content).hexdigest()
+    try:
+        for path, data in ((cache_dir / "objects" / digest, content), (key, digest.encode())):
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # Write atomically, in case of concurrent runs.
+            tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+            tmp.write_bytes(data)
+            tmp.replace(path)
+    except OSError as e:
+        LOGGER.warning(_("Can't cache {}: {}").format(url, e))
+    return content
+
+
+def load_uri(uri):
+    """
+    Load a JSON document referenced by a ``$ref``, like ``jsonref.jsonloader``, but fetch HTTP URLs with :func:`fetch`.
+
+    :param uri: The URI of the document
+    """
+    if uri.startswith(("http://", "https://")):
+        return json.loads(fetch(uri))
+    return jsonref.jsonloader(uri)
+
+
+def schema_digest(schema):
+    """
+    Return the SHA-256 hash of a schema.
+
+    >>> schema_digest({"type": "object"}) == schema_digest({"type": "object"})
+    True
+
+    :param schema: The schema, with its references resolved
+    :return: The hash
+    """
+    dumped = json.dumps(schema, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(dumped.encode()).hexdigest()
+
+
+def resolve_refs(schema, base_uri="", documents=None):
+    """
+    Return a copy of the schema, in which each ``$ref`` is replaced by the subschema that it references.
+
+    The copy contains only dicts and lists. The keys next to a ``$ref``, like ``title`` and ``deprecated``, override
+    the keys of the referenced subschema. Each referenced subschema is resolved once, and its values are shared by
+    the references to it. Remote documents are loaded with :func:`load_uri`.
+
+    >>> schema = {"definitions": {"a": {"type": "string"}}}
+    >>> schema["properties"] = {"b": {"$ref": "#/definitions/a", "title": "B"}}
+    >>> resolve_refs(schema)["properties"]["b"]
+    {'type': 'string', 'title': 'B'}
+
+    :param schema: The schema
+    :param base_uri: The URI against which to resolve relative references
+    :param documents: A mapping of URIs to the documents to use instead of loading them, or None
+    :return: The resolved schema
+    :raises ValueError: if a subschema references itself
+    """
+    documents = {**(documents or {}), base_uri: schema}
+    # Resolved subschemas, by URI and JSON Pointer, or by identity for subschemas without references.
+    resolved = {}
+    pending = set()
+
+    def resolve(node, uri):
+        if isinstance(node, list):
+            return [resolve(item, uri) for item in node]
+        if not isinstance(node, dict):
+            return node
+        ref = node.get("$ref")
+        if not isinstance(ref, str):
+            if id(node) not in resolved:
+                resolved[id(node)] = {key: resolve(value, uri) for key, value in node.items()}
+            return resolved[id(node)]
+
+        document_uri, pointer = urldefrag(urljoin(uri, ref))
+        key = (document_uri, pointer)
+        if key not in resolved:
+            if key in pending:
+                raise ValueError(_("Recursive reference in schema: {}").format(ref))
+            pending.add(key)
+            if document_uri not in documents:
+                documents[document_uri] = load_uri(document_uri)
+            target = documents[document_uri]
+            for part in pointer.split("/")[1:]:
+                part = unquote(part).replace("~1", "/").replace("~0", "~")  # JSON Pointer
+                target = target[int(part) if isinstance(target, list) else part]
+            resolved[key] = resolve(target, document_uri)
+            pending.discard(key)
+        # Each reference is a new dict, so that its own keys override the keys of the subschema only in this location.
+        result = dict(resolved[key])
+        result.update((name, resolve(value, uri)) for name, value in node.items() if name != "$ref")
+        return result
+
+    return resolve(schema, base_uri)
+
+
 def resolve_file_uri(file_path):
     """
     Read JSON file from provided URI.
 
+    URLs are fetched with :func:`fetch`, so that the bundled schemas and the local cache are used.
+
     :param file_path: URI to file, could be url or path
     :return: Read file as dictionary
     """
     if str(file_path).startswith(("http://", "https://")):
-        response = requests.get(file_path, timeout=10)
-        response.raise_for_status()
-        return response.json()
+        return json.loads(fetch(str(file_path)))
     if isinstance(file_path, (str, Path)):
         with open(file_path, encoding="utf-8") as fd:
             return json.load(fd, object_pairs_hook=OrderedDict)
     return None
 
 
+class ExtensionProfileBuilder(ProfileBuilder):
+    """
+    Profile builder that reads the release schema patches of extensions from a local directory or the local cache.
+
+    An extension is read from the subdirectory of ``extension_dir`` that is named like a segment of its URL's path,
+    like ``ocds_lots_extension``, if any. Otherwise, it is fetched with :func:`fetch`, so that it is downloaded only
+    once. If an extension can't be read, a warning is logged, and the extension is skipped.
+
+    :param standard_tag: The OCDS version tag, e.g. "1__1__5"
+    :param extension_versions: The URLs of the extensions
+    :param extension_dir: A directory of extensions, or None
+    """
+
+    def __init__(self, standard_tag, extension_versions, extension_dir=None, **kwargs):
+        super().__init__(standard_tag, extension_versions, **kwargs)
+        self.extension_dir = extension_dir
+        self._extensions = None
+
+    def extensions(self):
+        if self._extensions is None:
+            self._extensions = []
+            for extension in super().extensions():
+                try:
+                    content = self.get_release_schema_patch(extension)
+                except (OSError, ValueError, zipfile.BadZipFile) as e:
+                    LOGGER.warning(_("Skipping extension {}: {}").format(extension.input_url, e))
+                    continue
+                # Set the files of the extension, so that it doesn't download them.
+                extension._files = {"release-schema.json": content or "{}"}  # noqa: SLF001 # the extension's cache
+                self._extensions.append(extension)
+        return self._extensions
+
+    def get_release_schema_patch(self, extension):
+        """
+        Return the release schema patch of an extension, or None if the extension doesn't patch the release schema.
+
+        :param extension: An extension version
+        :return: The contents of the patch
+        """
+        if self.extension_dir:
+            for name in reversed(urlsplit(extension.input_url).path.split("/")):
+                path = Path(self.extension_dir) / name
+                if name and path.is_dir():
+                    path /= "release-schema.json"
+                    return path.read_text(encoding="utf-8") if path.is_file() else None
+
+        try:
+            url = extension.get_url("release-schema.json")
+        except NotImplementedError:
+            # The extension is available as a ZIP file only, whose first directory contains its files.
+            with zipfile.ZipFile(io.BytesIO(fetch(extension.download_url))) as archive:
+                for name in archive.namelist():
+                    if name.count("/") == 1 and name.endswith("/release-schema.json"):
+                        return archive.read(name).decode("utf-8")
+            return None
+
+        try:
+            return fetch(url).decode("utf-8")
+        except requests.HTTPError as e:
+            if e.response is not None and e.response.status_code == requests.codes.not_found:
+                return None
+            raise
+
+
 def read_lines(path):
     """Read file as lines."""
     with open(path, encoding="utf-8") as f:
@@ -247,7 +729,7 @@ def get_pointer(table, abs_path, path, split, *, index=None):  # noqa: ARG001
         return abs_path
 
     if array:
-        paths = abs_path.split(SEPARATOR)
+        paths = parse_path(abs_path).segments
         prefix = ""
 
         for i, pth in enumerate(paths, 1):  # noqa: B007 # used after
@@ -290,18 +772,425 @@ def make_count_column(array):
     return array.rstrip("/") + "Count"
 
 
+def get_byte_ranges(path, parts):
+    """
+    Split a line-delimited JSON file into at most ``parts`` byte ranges of roughly equal size.
+
+    Each range starts at the beginning of a line that opens a top-level JSON object, so that it can be parsed on its
+    own.
+
+    :param path: path to an uncompressed file
+    :param parts: number of ranges
+    :return: list of ``(start, end)`` offsets
+
+    >>> get_byte_ranges(Path('tests/data/ocds-sample-data.jsonl'), 1)
+    [(0, 40760)]
+    """
+    size = Path(path).stat().st_size
+    offsets = [0]
+    with open(path, "rb") as fd:
+        for part in range(1, parts):
+            fd.seek(max(size * part // parts, offsets[-1]))
+            fd.readline()
+            while True:
+                offset = fd.tell()
+                line = fd.readline()
+                if not line or line.startswith(b"{"):
+                    break
+            offsets.append(offset)
+    offsets.append(size)
+    return [(start, end) for start, end in pairwise(offsets) if end > start]
+
+
+class ByteRangeReader:
+    """
+    File-like object that reads a byte range of a file descriptor.
+
+    :param fd: File descriptor opened in binary mode
+    :param start: Offset of the first byte
+    :param end: Offset after the last byte
+    """
+
+    def __init__(self, fd, start, end):
+        fd.seek(start)
+        self.fd = fd
+        self.remaining = end - start
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.fd.read(size)
+        self.remaining -= len(data)
+        return data
+
+
+def get_shape(value):
+    """
+    Return the shape of a JSON value: its objects' keys, its arrays' lengths and its values' types, as a hashable
+    object.
+
+    Analyzing items of the same shape has the same result, except for the values in previews.
+
+    >>> get_shape({"id": "1", "tags": ["a"], "date": None})
+    (<class 'dict'>, (('id', <class 'str'>), ('tags', (<class 'list'>, (<class 'str'>,))), ('date', None)))
+    """
+    if isinstance(value, dict):
+        return (dict, tuple((sys.intern(key), get_shape(item)) for key, item in value.items()))
+    if isinstance(value, list):
+        return (list, tuple(get_shape(item) for item in value))
+    if value is None:
+        return None
+    return type(value)
+
+
+def item_from_shape(shape):
+    """
+    Return a JSON value of the given shape, with empty values, like empty strings and zeros.
+
+    :param shape: A shape returned by :func:`get_shape`
+
+    >>> item_from_shape(get_shape({"id": "1", "items": [{"quantity": 2}], "date": None}))
+    {'id': '', 'items': [{'quantity': 0}], 'date': None}
+    """
+    if shape is None:
+        return None
+    if isinstance(shape, tuple):
+        kind, shapes = shape
+        if kind is dict:
+            return {key: item_from_shape(item) for key, item in shapes}
+        return [item_from_shape(item) for item in shapes]
+    return shape()
+
+
+class ReadAheadReader:
+    """
+    File-like object that reads blocks of a file descriptor in a background thread, ahead of the consumer.
+
+    At most ``blocks`` blocks are buffered. As zlib releases the GIL while decompressing, reading and decompressing
+    overlap with parsing, analysis and flattening.
+
+    :param fd: File descriptor opened in binary mode
+    :param block_size: The number of bytes to read at once
+    :param blocks: The maximum number of blocks to buffer
+    :param raw: The compressed file that ``fd`` decompresses, if any, which is closed with the reader
+
+    >>> with ReadAheadReader(gzip.open('tests/data/ocds-sample-data.json.gz'), block_size=4) as f:
+    ...     _ = f.read(4)
+    ...     f.read(8), f.tell()
+    (b'"license', 12)
+    """
+
+    def __init__(self, fd, block_size=READ_AHEAD_BLOCK_SIZE, blocks=READ_AHEAD_BLOCKS, *, raw=None):
+        self.fd = fd
+        self.raw = raw
+        self.queue = queue.Queue(blocks)
+        self.block = b""
+        self.offset = 0
+        self.position = 0
+        self.eof = False
+        self.closed = False
+        self.thread = threading.Thread(target=self._fill, args=(block_size,), daemon=True)
+        self.thread.start()
+
+    def _fill(self, block_size):
+        try:
+            while not self.closed:
+                block = self.fd.read(block_size)
+                self._put(block)
+                if not block:
+                    return
+        except Exception as e:  # noqa: BLE001 # re-raised in the consumer's thread
+            self._put(e)
+
+    def _put(self, block):
+        # Stop waiting for space in the buffer if the consumer closes the reader.
+        while not self.closed:
+            try:
+                self.queue.put(block, timeout=0.1)
+            except queue.Full:
+                continue
+            else:
+                return
+
+    def read(self, size=-1):
+        chunks = []
+        while size != 0:
+            if self.offset == len(self.block):
+                if self.eof:
+                    break
+                block = self.queue.get()
+                if isinstance(block, Exception):
+                    raise block
+                if not block:
+                    self.eof = True
+                    break
+                self.block = block
+                self.offset = 0
+            end = len(self.block) if size < 0 else min(self.offset + size, len(self.block))
+            chunks.append(self.block[self.offset : end])
+            if size > 0:
+                size -= end - self.offset
+            self.offset = end
+        data = b"".join(chunks)
+        self.position += len(data)
+        return data
+
+    def tell(self):
+        return self.position
+
+    def input_tell(self):
+        """Return the position in the compressed file, or the position in the file if it isn't compressed."""
+        if self.raw:
+            return self.raw.tell()
+        return self.position
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.thread.join()
+            self.fd.close()
+            if self.raw:
+                self.raw.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def get_input_position(fd):
+    """
+    Return the number of bytes read from an input file, before decompression.
+
+    :param fd: File descriptor returned by a reader function from :func:`get_reader`
+    """
+    if isinstance(fd, (ReadAheadReader, RewindableReader)):
+        return fd.input_tell()
+    return fd.tell()
+
+
+class Throttle:
+    """
+    Callable that returns whether at least ``interval`` seconds have passed since it last returned True.
+
+    It returns True the first time. It's cheap enough to call once per item, to rate-limit progress reports.
+
+    :param interval: The minimum number of seconds between True results
+
+    >>> throttle = Throttle(60)
+    >>> throttle(), throttle()
+    (True, False)
+    """
+
+    def __init__(self, interval=PROGRESS_INTERVAL):
+        self.interval = interval
+        self.deadline = 0
+
+    def __call__(self):
+        now = time.monotonic()
+        if now < self.deadline:
+            return False
+        self.deadline = now + self.interval
+        return True
+
+
+def read_ahead(opener):
+    """
+    Return a reader function that opens a file with ``opener``, and reads it with a :class:`ReadAheadReader`.
+
+    :param opener: A function like ``open``
+    :return: reader function
+    """
+
+    @functools.wraps(opener)
+    def reader(path, mode="rb"):
+        raw = open(path, mode)  # noqa: SIM115 # closed with the reader
+        return ReadAheadReader(opener(raw, mode), raw=raw)
+
+    return reader
+
+
+def get_decompressor(first_bytes, name):
+    """
+    Return the function that opens a file object compressed in the format identified by the file's first bytes.
+
+    :param first_bytes: The first bytes of the file, at least as many as ``MAGIC_NUMBER_LENGTH``
+    :param name: The file's name, for error messages
+    :return: A function like ``gzip.open``, or None if the file isn't compressed
+    :raises ValueError: if the file is compressed with Zstandard and no decoder is installed
+
+    >>> get_decompressor(b'BZh91AY&', 'file.json.bz2') is bz2.open
+    True
+    >>> get_decompressor(b'{"releases": []}', 'file.json') is None
+    True
+    """
+    if (first_bytes[0:1], first_bytes[1:2]) == GZIP_MAGIC_NUMBER:
+        return gzip.open
+    if first_bytes.startswith(BZ2_MAGIC_NUMBER):
+        return bz2.open
+    if first_bytes.startswith(XZ_MAGIC_NUMBER):
+        return lzma.open
+    if first_bytes.startswith(ZSTD_MAGIC_NUMBER):
+        if zstd is None:
+            raise ValueError(_("Install zstandard to read the Zstandard-compressed file {}").format(name))
+        return zstd.open
+    return None
+
+
 def get_reader(path):
     """
     Get reader function for a respective file format.
 
+    Files compressed with gzip, bzip2, xz or Zstandard are detected by their magic number, and decompressed in a
+    background thread.
+
     :param path: path to a file
     :return: reader function
+    :raises ValueError: if the file is compressed with Zstandard and no decoder is installed
     """
     with open(path, "rb") as f:
-        first_bytes = f.read(2)
-    if (first_bytes[0:1], first_bytes[1:2]) == GZIP_MAGIC_NUMBER:
-        return gzip.open
-    return open
+        first_bytes = f.read(MAGIC_NUMBER_LENGTH)
+    decompressor = get_decompressor(first_bytes, path)
+    if decompressor is None:
+        return open
+    return read_ahead(decompressor)
+
+
+class RewindableReader:
+    """
+    File-like object that keeps the bytes read from a stream until :meth:`rewind` is called, to read them again.
+
+    This allows sniffing the start of a stream that can't seek, like standard input. Sniffing can read the whole
+    stream, so at most ``max_buffer`` bytes are kept in memory: the others are kept in a compressed temporary file.
+
+    :param fd: File descriptor opened in binary mode, which isn't closed with the reader
+    :param max_buffer: The maximum number of kept bytes to hold in memory
+
+    >>> import io
+    >>> reader = RewindableReader(io.BytesIO(b'{"releases": []}'))
+    >>> reader.read(3)
+    b'{"r'
+    >>> reader.rewind()
+    >>> reader.read(5), reader.read(), reader.tell()
+    (b'{"rel', b'eases": []}', 16)
+    """
+
+    def __init__(self, fd, max_buffer=REWIND_BUFFER_SIZE):
+        self.fd = fd
+        self.max_buffer = max_buffer
+        # The kept bytes are those in the spill file, followed by those in the buffer.
+        self.buffer = bytearray()
+        self.spill = None
+        self.writer = None
+        # While reading the kept bytes again, the reader of the spill file and the offset in the buffer.
+        self.replay = None
+        self.offset = None
+        self.position = 0
+        self.keep = True
+
+    def read(self, size=-1):
+        data = bytearray()
+        while size < 0 or len(data) < size:
+            chunk = self._read(size if size < 0 else size - len(data))
+            if not chunk:
+                break
+            data += chunk
+        self.position += len(data)
+        return bytes(data)
+
+    def _read(self, size):
+        if self.replay is not None:
+            data = self.replay.read(size)
+            if data:
+                return data
+            self.replay.close()
+            self.replay = None
+            if not self.keep:
+                self._release_spill()
+        if self.offset is not None:
+            end = len(self.buffer) if size < 0 else self.offset + size
+            data = bytes(self.buffer[self.offset : end])
+            self.offset += len(data)
+            if data:
+                return data
+            # Stop replaying, and release the buffer unless the bytes are kept.
+            self.offset = None
+            if not self.keep:
+                self.buffer = bytearray()
+        data = self.fd.read(size)
+        if self.keep:
+            self._keep(data)
+        return data
+
+    def _keep(self, data):
+        self.buffer += data
+        if len(self.buffer) > self.max_buffer:
+            if self.writer is None:
+                if self.spill is None:
+                    self.spill = tempfile.TemporaryFile()  # noqa: SIM115 # closed with the reader
+                # Each rewind ends a gzip member. A new member is appended to the file, and all are read again.
+                self.spill.seek(0, io.SEEK_END)
+                self.writer = gzip.GzipFile(fileobj=self.spill, mode="wb", compresslevel=1)
+            self.writer.write(self.buffer)
+            self.buffer = bytearray()
+
+    def _release_spill(self):
+        if self.spill is not None:
+            self.spill.close()
+            self.spill = None
+
+    def rewind(self, *, keep=False):
+        """
+        Read the kept bytes again.
+
+        :param keep: Whether to keep the bytes that are read, to rewind again. Otherwise, stop keeping bytes.
+        """
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+        if self.replay is not None:
+            self.replay.close()
+            self.replay = None
+        if self.spill is not None:
+            self.spill.seek(0)
+            self.replay = gzip.GzipFile(fileobj=self.spill, mode="rb")
+        self.offset = 0
+        self.position = 0
+        self.keep = keep
+
+    def tell(self):
+        return self.position
+
+    def input_tell(self):
+        """Return the number of bytes read from the stream, before decompression."""
+        return get_input_position(self.fd)
+
+    def close(self):
+        if self.replay is not None:
+            self.replay.close()
+            self.replay = None
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+        self._release_spill()
+
+
+def open_stream(fd):
+    """
+    Return a file-like object that reads a binary stream, decompressing it in a background thread if it's compressed.
+
+    The compression format is sniffed from the start of the stream, so the stream doesn't need to be seekable.
+
+    :param fd: File descriptor opened in binary mode, like ``sys.stdin.buffer``
+    :return: A :class:`ReadAheadReader`
+    """
+    raw = RewindableReader(fd)
+    decompressor = get_decompressor(raw.read(MAGIC_NUMBER_LENGTH), getattr(fd, "name", "-"))
+    raw.rewind()
+    if decompressor is None:
+        return ReadAheadReader(raw, raw=raw)
+    return ReadAheadReader(decompressor(raw, "rb"), raw=raw)
 
 
 def get_order(properties):
@@ -337,21 +1226,30 @@ class SchemaHeaderExtractor:
     Human-readable headers extracted from schema.
 
     :param schema: The dataset's schema
+    :param language: The language of the schema's titles, under which headers are stored on tables
     """
 
-    def __init__(self, schema):
+    def __init__(self, schema, language=LOCALE):
         self.schema = schema
-        if not isinstance(self.schema, jsonref.JsonRef) and not isinstance(self.schema, OrderedDict):
-            self.schema = jsonref.JsonRef.replace_refs(self.schema)
+        self.language = language
+        if self.schema is not None:
+            self.schema = resolve_refs(self.schema)
+        self._titles = {}
+
+    def _get_title(self, path):
+        # Titles are shared by the headers of many columns, like the titles of their ancestors.
+        key = tuple(path)
+        if key not in self._titles:
+            _object = self.schema["properties"]
+            for part in path:
+                _object = _object[part]
+            self._titles[key] = _object
+        return self._titles[key]
 
     def _get_header(self, header, paths):
         final_title = []
         for path in paths:
-            _object = Cut(self.schema)["properties." + ".".join(path[:-1])]
-            if hasattr(_object, "__reference__") and "title" in _object.__reference__:
-                title = _object.__reference__["title"]
-            else:
-                title = Cut(self.schema)["properties." + ".".join(path)]
+            title = self._get_title(path)
             if isinstance(title, dict):
                 continue
             final_title.append(title)
@@ -368,6 +1266,29 @@ class SchemaHeaderExtractor:
             return nonschema_title_formatter(header)
         return nonschema_title_formatter(paths)
 
+    def get_table_header(self, table, column):
+        """
+        Return the human-readable header of a table's column.
+
+        The header is computed once per language, and stored on the table, so that it is shared by all writers and
+        kept in the state file. The columns of items after the first in an array have the header of the first item.
+
+        :param table: A table object
+        :param column: The column's path
+        :return: The header
+        """
+        headers = table.human_headers.setdefault(self.language, {})
+        if column not in headers:
+            path = ARRAY_INDEX.sub("0", column)
+            if path == column:
+                # Columns that are absent from the schema have no title, or their path as title.
+                paths = table.titles.get(path) or path
+                header = self.get_header(path, paths)
+                headers[column] = nonschema_title_formatter(header) if paths and isinstance(paths, list) else header
+            else:
+                headers[column] = self.get_table_header(table, path)
+        return headers[column]
+
 
 def generate_paths(source):
     """
@@ -386,57 +1307,49 @@ def generate_paths(source):
 
 def add_paths_to_schema(schema):
     """
-    Extract full path for each title in schema. Create paths list of full title for each.
+    Return a copy of the schema, in which each subschema with a title is annotated with the paths to titles.
 
-    :param unres_schema: Unresolved schema
-    :param schema: Schema object that will be updated
-    :return: Schema with full title paths
-    """
-    proxy = Cut(copy.deepcopy(schema))
-    updated_items = {}
-    for table in proxy["properties"]:
-        path_item = Cut({table: copy.deepcopy(proxy["properties"][table])})
-        # Generating path to each title in schema
-        for path in generate_paths({table: proxy["properties"][table]}):
-            if path[-1] == "title":
-                object_path = ".".join(path[:-1])
-                path_item[object_path]["$path"] = path
-        updated_items[table] = path_item[table]
-    proxy["properties"] = updated_items
-    # Generating array with title paths for each title in schema
-    for path_list in list(title_path(proxy["properties"])):
-        location = "properties." + ".".join(path_list[-1][:-1])
-        proxy[location]["$title"] = path_list
-
-    return proxy
+    Paths are lists of keys from the schema's ``properties``. Each annotated subschema has a ``$path`` key, with the
+    path to its title, and a ``$title`` key, with the paths to the titles of it and of its annotated ancestors.
 
+    >>> schema = add_paths_to_schema({"properties": {"tender": {"title": "Tender", "properties": {}}}})
+    >>> schema["properties"]["tender"]["$title"]
+    [['tender', 'title']]
 
-def title_path(schema, path=()):
+    :param schema: The schema
+    :return: The annotated schema
     """
-    Get path for each previous title and form full list of titles for each object.
+    annotated = {}
+    for key, value in schema.items():
+        if key == "properties":
+            annotated[key] = {}
+            for name, prop in value.items():
+                # Each property is copied separately, so that definitions are shared only within a property.
+                annotated[key][name] = copy.deepcopy(prop)
+                _add_paths(annotated[key][name], [name], [])
+        else:
+            annotated[key] = copy.deepcopy(value)
+    return annotated
 
-    :param schema: Object
-    :param path: List of paths for full title
-    :return:
-    """
-    for value in schema.values():
-        newpath = list(path)
-        if "$path" in schema:
-            newpath.append(schema["$path"])
+
+def _add_paths(schema, path, titles):
+    # A definition that is referenced more than once within a property is copied once, like in any deep copy. Its
+    # annotations are overwritten at each location, and are those of the last location.
+    if "title" in schema:
+        titles = [*titles, [*path, "title"]]
+    for key, value in schema.items():
         if isinstance(value, dict):
-            for result in title_path(value, newpath):
-                if result:
-                    yield result
-        elif newpath:
-            yield newpath
+            _add_paths(value, [*path, key], titles)
+    if "title" in schema:
+        schema["$path"] = titles[-1]
+        schema["$title"] = titles
 
 
 def get_nestiness(abs_path):
-    arrays = [c for c in abs_path if c.isdigit()]
-    return len(arrays) - 1
+    return len(parse_path(abs_path).indexes) - 1
 
 
 def get_path_for_array_col(abs_path, array):
     nestiness = get_nestiness(abs_path)
-    chunks = abs_path.split("/")[len(array.split("/")) + nestiness :]
+    chunks = parse_path(abs_path).segments[len(parse_path(array).segments) + nestiness :]
     return "/".join(chain([array], chunks))
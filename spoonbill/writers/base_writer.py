@@ -1,16 +1,18 @@
 from collections import defaultdict
 
+from spoonbill.i18n import LOCALE
 from spoonbill.utils import SchemaHeaderExtractor
 
 
 class BaseWriter:
     """Base writer class."""
 
-    def __init__(self, workdir, tables, options, schema):
+    def __init__(self, workdir, tables, options, schema, language=LOCALE):
         """
         :param workdir: Working directory
         :param tables: The table objects
         :param options: Flattening options
+        :param language: Language of the human-readable headings
         """
         self.workdir = workdir
         self.tables = tables
@@ -19,7 +21,7 @@ class BaseWriter:
         self.headers = {}
         self.names_counter = defaultdict(int)
         self.schema = schema
-        self.schema_headers = SchemaHeaderExtractor(self.schema)
+        self.schema_headers = SchemaHeaderExtractor(self.schema, language)
 
     def get_headers(self, table, options):
         """
@@ -40,15 +42,7 @@ class BaseWriter:
         ):
             self.options.selection[table.name].pretty_headers = True
         if options.pretty_headers:
-            for c in headers:
-                headers[c] = table.titles.get(c, c)
-                for k, v in headers.items():
-                    headers[k] = self.schema_headers.get_header(k, v)
-            for col in headers:
-                for char in col:
-                    if char.isnumeric() and char != "0":
-                        title_col = col.replace(char, "0")
-                        headers[col] = headers[title_col]
+            headers = {c: self.schema_headers.get_table_header(table, c) for c in headers}
 
         if options.headers:
             headers.update(options.headers)
@@ -1,7 +1,7 @@
 import csv
 import logging
 
-from spoonbill.i18n import _
+from spoonbill.i18n import LOCALE, _
 from spoonbill.writers.base_writer import BaseWriter
 
 LOGGER = logging.getLogger("spoonbill")
@@ -16,13 +16,14 @@ class CSVWriter(BaseWriter):
 
     name = "csv"
 
-    def __init__(self, workdir, tables, options, schema):
+    def __init__(self, workdir, tables, options, schema, language=LOCALE):
         """
         :param workdir: Working directory
         :param tables: The table objects
         :param options: Flattening options
+        :param language: Language of the human-readable headings
         """
-        super().__init__(workdir, tables, options, schema=schema)
+        super().__init__(workdir, tables, options, schema=schema, language=language)
         self.writers = {}
         self.fds = []
 
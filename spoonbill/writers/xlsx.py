@@ -4,7 +4,7 @@ import logging
 import xlsxwriter
 from xlsxwriter.exceptions import XlsxWriterException
 
-from spoonbill.i18n import _
+from spoonbill.i18n import LOCALE, _
 from spoonbill.writers.base_writer import BaseWriter
 
 LOGGER = logging.getLogger("spoonbill")
@@ -19,13 +19,14 @@ class XlsxWriter(BaseWriter):
 
     name = "xlsx"
 
-    def __init__(self, workdir, tables, options, schema, filename="result.xlsx"):
+    def __init__(self, workdir, tables, options, schema, filename="result.xlsx", language=LOCALE):
         """
         :param workdir: Working directory
         :param tables: The table objects
         :param options: Flattening options
+        :param language: Language of the human-readable headings
         """
-        super().__init__(workdir, tables, options, schema=schema)
+        super().__init__(workdir, tables, options, schema=schema, language=language)
         self.col_index = collections.defaultdict(dict)
         self.path = workdir / filename
         self.workbook = xlsxwriter.Workbook(self.path, {"constant_memory": True})
@@ -7,6 +7,8 @@ BASE_DIR = pathlib.Path(__file__).parent
 SCHEMA_PATH = BASE_DIR / "data" / "ocds-simplified-schema.json"
 RELEASES_PATH = BASE_DIR / "data" / "ocds-sample-data.json"
 RELEASES_EXTENSION_PATH = BASE_DIR / "data" / "ocds-sample-data-extension.json"
+RELEASES_JSONL_PATH = BASE_DIR / "data" / "ocds-sample-data.jsonl"
+RELEASES_GZ_PATH = BASE_DIR / "data" / "ocds-sample-data.json.gz"
 
 TEST_ROOT_TABLES = deepcopy(ROOT_TABLES)
 TEST_COMBINED_TABLES = {
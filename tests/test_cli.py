@@ -285,6 +285,16 @@ def test_gz():
         assert result.exit_code == 0
 
 
+def test_stdin():
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        result = runner.invoke(cli, ["--schema", SCHEMA, "-"], input=FILENAME_GZ.read_bytes())
+        assert result.exit_code == 0
+        assert "Input file is release package" in result.output
+        assert "Done flattening. Flattened objects: 6" in result.output
+        assert pathlib.Path("stdin.state").exists()
+
+
 def test_sheet_order():
     runner = CliRunner()
     with runner.isolated_filesystem():
@@ -331,6 +341,37 @@ def test_sheet_order_state_file():
             ]
 
 
+def test_schemaless():
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        shutil.copyfile(FILENAME, "data.json")
+        result = runner.invoke(cli, ["--schemaless", "--human", "data.json"])
+        assert result.exit_code == 0
+        assert "No schema used" in result.output
+        with open("result.xlsx", "rb") as f:
+            workbook = openpyxl.load_workbook(f)
+            # The tables are ordered like the root tables.
+            assert workbook.sheetnames == [
+                "tenders",
+                "awards",
+                "contracts",
+                "planning",
+                "parties",
+                "parties_ids",
+                "documents",
+                "milestones",
+                "amendments",
+            ]
+            assert "Tender: Procurement Method" in [cell.value for cell in workbook["tenders"][1]]
+
+
+def test_schemaless_schema():
+    runner = CliRunner()
+    result = runner.invoke(cli, ["--schemaless", "--schema", SCHEMA, str(FILENAME)])
+    assert result.exit_code == 2
+    assert "can't be used together" in result.output
+
+
 @mock.patch.dict(os.environ, {"LANG": "uk_UA"})
 def test_locale_not_found():
     runner = CliRunner()
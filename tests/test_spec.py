@@ -1,5 +1,8 @@
-from spoonbill.spec import add_child_table
-from spoonbill.utils import combine_path, get_pointer
+import pickle
+from copy import deepcopy
+
+from spoonbill.spec import Columns, Table, add_child_table
+from spoonbill.utils import combine_path, get_path_for_array_col, get_pointer
 
 
 def test_combine_path(root_table):
@@ -136,6 +139,14 @@ def test_is_array(root_table):
     assert not root_table.is_array("/tender/id")
     assert not root_table.is_array("/tender/title")
     assert not root_table.is_array("/tender/submissionMethod")
+    # The innermost array is returned.
+    assert (
+        root_table.is_array("/tender/items/additionalClassifications/id") == "/tender/items/additionalClassifications"
+    )
+    assert not root_table.is_array("/tender/itemsCount")
+
+    root_table.set_array("/tender/tenderers", [{}])
+    assert root_table.is_array("/tender/tenderers/id") == "/tender/tenderers"
 
 
 def test_add_child_table(root_table):
@@ -145,6 +156,12 @@ def test_add_child_table(root_table):
     assert child.total_rows == 0
     assert child.parent == root_table
 
+    child_child = add_child_table(
+        child, "/tender/tenderers/additionalIdentifiers", "tenderers", "additionalIdentifiers"
+    )
+    assert child_child.get_lineage() == [child_child, child, root_table]
+    assert root_table.get_lineage() == [root_table]
+
 
 def test_get_pointer(root_table):
     child = add_child_table(root_table, "/tender/items", "tender", "items")
@@ -195,3 +212,74 @@ def test_get_pointer(root_table):
 
     pointer = get_pointer(root_table, "/tender", "/tender", True, index="0")
     assert pointer == "/tender"
+
+
+def test_get_path_for_array_col():
+    path = get_path_for_array_col("/tender/items/1/id", "/tender/items")
+    assert path == "/tender/items/1/id"
+    path = get_path_for_array_col("/tender/items/12/id", "/tender/items")
+    assert path == "/tender/items/12/id"
+    path = get_path_for_array_col(
+        "/tender/items/1/additionalClassifications/2/id", "/tender/items/additionalClassifications"
+    )
+    assert path == "/tender/items/additionalClassifications/2/id"
+    # Digits in keys aren't array indexes.
+    path = get_path_for_array_col("/tender/items/1/line2", "/tender/items")
+    assert path == "/tender/items/1/line2"
+
+
+def test_columns():
+    columns = Columns({"a": 1, "c": 3})
+    columns.insert_after("a", "b", 2)
+    columns["d"] = 4
+    assert list(columns) == ["a", "b", "c", "d"]
+    assert list(columns.items()) == [("a", 1), ("b", 2), ("c", 3), ("d", 4)]
+    assert {**columns} == {"a": 1, "b": 2, "c": 3, "d": 4}
+
+    del columns["a"]
+    assert columns.pop("d") == 4
+    columns.insert_after("c", "e", 5)
+    assert list(columns) == ["b", "c", "e"]
+    assert list(reversed(columns)) == ["e", "c", "b"]
+    assert list(pickle.loads(pickle.dumps(columns))) == ["b", "c", "e"]
+
+
+def test_columns_version():
+    columns = Columns({"a": 1})
+    version = columns.version
+    columns["a"] = 2
+    assert columns.version == version + 1
+    columns.insert_after("a", "b", 3)
+    assert columns.version == version + 2
+    del columns["a"]
+    assert columns.version == version + 3
+    columns.clear()
+    assert columns.version == version + 4
+
+
+def test_columns_unpickle_dict(root_table):
+    # Tables pickled before Columns hold dicts.
+    state = {**root_table.__dict__, "combined_columns": dict(root_table.combined_columns)}
+    table = Table.__new__(Table)
+    table.__setstate__(state)
+    assert isinstance(table.combined_columns, Columns)
+    assert list(table.combined_columns) == list(root_table.combined_columns)
+
+
+def test_merge(root_table):
+    other = deepcopy(root_table)
+    other.add_column("/tender/test", ["string"], "/tender/test", additional=True)
+    other.inc_column("/tender/awardCriteriaDetails", "/tender/awardCriteriaDetails")
+    other.set_array("/tender/items", list(range(3)))
+    other.total_rows = 2
+    root_table.add_column("/tender/other", ["string"], "/tender/other", additional=True)
+    root_table.inc_column("/tender/awardCriteriaDetails", "/tender/awardCriteriaDetails")
+    root_table.total_rows = 1
+
+    root_table.merge(other)
+
+    assert root_table.total_rows == 3
+    assert root_table.arrays["/tender/items"] == 3
+    assert root_table.combined_columns["/tender/awardCriteriaDetails"].hits == 2
+    assert list(root_table.combined_columns)[-2:] == ["/tender/other", "/tender/test"]
+    assert "/tender/test" in root_table.additional_columns
@@ -1,15 +1,29 @@
+import bz2
+import copy
+import gzip
+import io
+import json
+import lzma
+import pickle
+import random
+from dataclasses import replace
 from operator import attrgetter
+from pathlib import Path
 from unittest.mock import call, mock_open, patch
 
 import pytest
+import requests
 from jmespath import search
 from jsonpointer import resolve_pointer
 
-from spoonbill.common import JOINABLE_SEPARATOR
+from spoonbill import FileAnalyzer, utils
+from spoonbill.common import DEFAULT_SCHEMA_URL, JOINABLE_SEPARATOR, STANDARD_URL
 from spoonbill.spec import Column, Table
-from spoonbill.stats import DataPreprocessor
-from spoonbill.utils import insert_after_key
+from spoonbill.stats import DataPreprocessor, PreviewCollector
+from spoonbill.utils import fetch, get_matching_tables, get_shape, resolve_file_uri, resolve_refs
 from tests.data import (
+    RELEASES_GZ_PATH,
+    RELEASES_JSONL_PATH,
     SCHEMA_PATH,
     TEST_COMBINED_TABLES,
     TEST_ROOT_TABLES,
@@ -78,11 +92,165 @@ def test_parse_schema(schema, spec):
             assert col == 0
 
 
+def test_parse_schema_tables_cache(schema, spec, releases, tmpdir):
+    kwargs = {"combined_tables": TEST_COMBINED_TABLES, "tables_cache": tmpdir}
+    cached = DataPreprocessor(schema, TEST_ROOT_TABLES, **kwargs)
+    assert len(tmpdir.listdir()) == 1
+
+    with patch.object(DataPreprocessor, "walk_schema") as walk_schema:
+        restored = DataPreprocessor(schema, TEST_ROOT_TABLES, **kwargs)
+
+    walk_schema.assert_not_called()
+    for dp in cached, restored:
+        assert dp.tables == spec.tables
+        assert dp["tenders_items"].parent is dp["tenders"]
+        list(dp.process_items(releases))
+    assert restored.tables == cached.tables
+
+    # A different configuration is cached separately.
+    DataPreprocessor(schema, TEST_ROOT_TABLES, language="es", tables_cache=tmpdir)
+    assert len(tmpdir.listdir()) == 2
+
+
+def test_parse_schema_tables_cache_disabled(schema):
+    # The schema isn't hashed if the tables aren't cached.
+    with patch("spoonbill.stats.schema_digest") as schema_digest:
+        dp = DataPreprocessor(schema, TEST_ROOT_TABLES, combined_tables=TEST_COMBINED_TABLES)
+
+    schema_digest.assert_not_called()
+    assert dp.tables_cache_path() is None
+
+
+@patch("spoonbill.LOGGER.warning")
+def test_parse_schema_tables_cache_invalid(log, schema, spec, tmpdir):
+    DataPreprocessor(schema, TEST_ROOT_TABLES, combined_tables=TEST_COMBINED_TABLES, tables_cache=tmpdir)
+    tmpdir.listdir()[0].write_binary(b"invalid")
+    dp = DataPreprocessor(schema, TEST_ROOT_TABLES, combined_tables=TEST_COMBINED_TABLES, tables_cache=tmpdir)
+
+    assert dp.tables == spec.tables
+    assert "Ignoring invalid tables cache file" in log.call_args[0][0]
+
+
 def test_resolve_schema_uri():
     dp = DataPreprocessor(SCHEMA_PATH, TEST_ROOT_TABLES, combined_tables=TEST_COMBINED_TABLES)
     assert isinstance(dp.schema, dict)
 
 
+def test_resolve_refs():
+    schema = {
+        "definitions": {"Value": {"title": "Value", "properties": {"amount": {"type": "number"}}}},
+        "properties": {
+            "value": {"$ref": "#/definitions/Value"},
+            "minValue": {
+                "$ref": "#/definitions/Value",
+                "title": "Minimum value",
+                "deprecated": {"deprecatedVersion": "1.1"},
+            },
+        },
+    }
+    resolved = resolve_refs(schema)
+
+    value = resolved["properties"]["value"]
+    min_value = resolved["properties"]["minValue"]
+    assert type(value) is dict
+    assert value["title"] == "Value"
+    assert min_value["title"] == "Minimum value"
+    assert min_value["deprecated"] == {"deprecatedVersion": "1.1"}
+    assert "$ref" not in min_value
+    assert value["properties"] is min_value["properties"]
+
+
+def test_resolve_refs_recursive():
+    schema = {"definitions": {"Node": {"properties": {"child": {"$ref": "#/definitions/Node"}}}}}
+    with pytest.raises(ValueError, match="Recursive reference in schema"):
+        resolve_refs(schema)
+
+
+def test_parse_schema_deprecated_ref():
+    schema = {
+        "definitions": {
+            "Period": {"type": "object", "properties": {"startDate": {"title": "Start date", "type": "string"}}},
+        },
+        "properties": {
+            "tender": {
+                "title": "Tender",
+                "type": "object",
+                "properties": {
+                    "id": {"title": "ID", "type": "string"},
+                    "tenderPeriod": {"$ref": "#/definitions/Period"},
+                    "enquiryPeriod": {"$ref": "#/definitions/Period", "deprecated": {"deprecatedVersion": "1.1"}},
+                },
+            },
+        },
+    }
+    dp = DataPreprocessor(schema, {"tenders": ["/tender"]})
+    assert "/tender/tenderPeriod/startDate" in dp["tenders"]
+    assert "/tender/enquiryPeriod/startDate" not in dp["tenders"]
+
+
+def test_parse_schema_organization_references():
+    dp = DataPreprocessor(utils.SCHEMA_DIR / "1.1" / "en" / "release-schema.json", TEST_ROOT_TABLES)
+
+    # The properties of organization references that are deprecated next to their $ref are skipped.
+    assert "/buyer/name" in dp["parties"]
+    assert "/buyer/identifier/id" not in dp["parties"]
+    for name in ("identifier/id", "address/countryName", "contactPoint/email"):
+        assert f"/tender/procuringEntity/{name}" not in dp["tenders"]
+
+
+def test_analyze_schemaless(spec, releases):
+    list(spec.process_items(releases))
+    schemaless = DataPreprocessor(None, TEST_ROOT_TABLES, combined_tables=TEST_COMBINED_TABLES)
+    list(schemaless.process_items(releases))
+
+    for name, table in spec.tables.items():
+        if not table.total_rows:
+            assert name not in schemaless.tables
+            continue
+        other = schemaless[name]
+        assert other.total_rows == table.total_rows
+        assert {col_id: col.hits for col_id, col in other.combined_columns.items() if col.hits} == {
+            col_id: col.hits for col_id, col in table.combined_columns.items() if col.hits
+        }
+
+
+def test_resolve_schema_uri_bundled():
+    with patch("requests.get") as get:
+        schema = resolve_file_uri(DEFAULT_SCHEMA_URL["releases"]["en"])
+
+    get.assert_not_called()
+    assert schema["title"] == "Schema for an Open Contracting Release Package"
+
+
+@pytest.mark.parametrize("path", ["../__init__.py", "1.1/en/../../../__init__.py", "/etc/hostname"])
+def test_resolve_schema_uri_bundled_traversal(tmpdir, path):
+    url = STANDARD_URL + path
+    with patch("requests.get") as get:
+        get.return_value.content = b"{}"
+        assert fetch(url, cache_dir=Path(tmpdir)) == b"{}"
+
+    get.assert_called_once_with(url, timeout=10)
+
+
+def test_resolve_schema_uri_cache(tmpdir):
+    url = "https://example.com/schema.json"
+    with patch("requests.get") as get:
+        get.return_value.content = b'{"title": "Schema"}'
+        assert fetch(url, cache_dir=Path(tmpdir)) == b'{"title": "Schema"}'
+        assert fetch(url, cache_dir=Path(tmpdir)) == b'{"title": "Schema"}'
+
+    get.assert_called_once_with(url, timeout=10)
+    assert len(list((Path(tmpdir) / "objects").iterdir())) == 1
+
+    # A corrupt cache file is fetched again.
+    next((Path(tmpdir) / "objects").iterdir()).write_bytes(b"{}")
+    with patch("requests.get") as get:
+        get.return_value.content = b'{"title": "Schema"}'
+        assert fetch(url, cache_dir=Path(tmpdir)) == b'{"title": "Schema"}'
+
+    get.assert_called_once_with(url, timeout=10)
+
+
 def test_get_table(spec, releases):
     table = spec.get_table("/tender")
     assert table.name == "tenders"
@@ -101,6 +269,16 @@ def test_get_table(spec, releases):
     assert table.name == "planning"
     table = spec.get_table("/parties")
     assert table.name == "parties"
+    assert spec.get_table("/ocid") is None
+
+    # The index is updated when a table is added.
+    spec.current_table = spec["tenders"]
+    spec.add_additional_table("/tender/extension", "/tender/extension", "tender", "extension", [{"id": "1"}])
+    table = spec.get_table("/tender/extension/id")
+    assert table.name == "tenders_extension"
+
+    for path in ("/tender/documents/id", "/contracts/implementation/documents", "/tender/items/unit/value/amount"):
+        assert spec.get_table(path) is get_matching_tables(spec.tables, path)[0]
 
 
 def test_analyze(spec, releases):
@@ -143,6 +321,57 @@ def test_mismatched_types(log, spec, releases):
     log.assert_has_calls([call("Mismatched type on %s expected %s", "/tender/id", ["string", "integer"])])
 
 
+@patch("spoonbill.LOGGER.error")
+def test_mismatched_types_dispatched(log, spec, releases):
+    hits = len(search("[].tender.id", releases))
+    # The type of a later value is checked against the compiled dispatch table.
+    releases[3]["tender"]["id"] = ["/test/id"]
+    for _ in spec.process_items(releases):
+        pass
+    log.assert_has_calls([call("Mismatched type on %s expected %s", "/tender/id", ["string", "integer"])])
+    assert spec.tables["tenders"]["/tender/id"].hits == hits - 1
+
+
+def test_dispatch(spec, releases):
+    for _ in spec.process_items(releases):
+        pass
+    dispatch = spec.dispatch[("/tender", "tender")]["id"]
+    assert dispatch.pointer == "/tender/id"
+    assert dispatch.table is spec.tables["tenders"]
+    assert not dispatch.new_row
+    assert spec.dispatch[("", "")]["tender"].new_row
+    assert spec.dispatch[("", "")]["ocid"] is False
+    assert ("/tender/items", "tender") in spec.dispatch
+
+    # Adding a table clears the dispatch table.
+    releases[0]["tender"]["items"][0]["additional"] = [{"id": "1"}]
+    for _ in spec.process_items(releases[:1]):
+        pass
+    assert ("/tender/items", "tender") not in spec.dispatch
+    assert spec.dispatch[("/tender/items/additional", "tender")]["id"].table is spec.tables["tenders_items_additional"]
+
+    spec2 = pickle.loads(pickle.dumps(spec))
+    assert spec2.dispatch == {}
+    assert spec2.tables == spec.tables
+
+
+def test_flush_hits(spec):
+    spec.current_table = spec["tenders_items"]
+    spec.pending_rows["tenders_items"] += 2
+    spec.count_hit("/tender/items/0/id", "/tender/items/id")
+    spec.count_hit("/tender/items/0/id", "/tender/items/id")
+    assert spec["tenders_items"].total_rows == 0
+    assert spec["tenders_items"].combined_columns["/tender/items/id"].hits == 0
+
+    spec.flush_hits()
+    assert spec["tenders_items"].total_rows == 2
+    assert spec["tenders_items"].combined_columns["/tender/items/id"].hits == 2
+    assert spec["tenders_items"].combined_columns["parentTable"].hits == 2
+    assert spec["tenders"].combined_columns["/tender/items/0/id"].hits == 2
+    assert spec["tenders"].total_rows == 0
+    assert not spec.pending_hits
+
+
 @patch("spoonbill.LOGGER.error")
 def test_dump_restore(log, spec, releases, tmpdir):
     for _ in spec.process_items(releases):
@@ -175,56 +404,29 @@ def test_dump_restore(log, spec, releases, tmpdir):
         log.assert_has_calls([call("Invalid pickle file. Can't restore.")])
 
 
-def test_recalculate_headers(root_table, releases):
-    items = releases[0]["tender"]["items"]
-    insert_after_key(root_table.combined_columns, "/tender", "items")
-    for key in (
-        "/tender/items/0/id",
-        "/tender/items/0/additionalClassifications/0/id",
-    ):
-        assert key in root_table.combined_columns
+def test_recalculate_headers(root_table):
+    columns = root_table.combined_columns
+    for key in ("/tender/items/0/id", "/tender/items/0/additionalClassifications/0/id"):
+        assert key in columns
         assert key in root_table.columns
     for key in ("/tender/items/1/id", "/tender/items/1/additionalClassifications/0/id"):
-        assert key not in root_table.combined_columns
+        assert key not in columns
         assert key not in root_table.columns
-    items = items * 2
-    insert_after_key(root_table.combined_columns, "/tender", "items")
 
-    for key in (
-        "/tender/items/0/id",
-        "/tender/items/0/additionalClassifications/0/id",
+    # The columns of array items beyond the first are inserted after the array's last column, in the combined columns.
+    for last_key, key in (
+        ("/tender/items/0/id", "/tender/items/1/id"),
+        ("/tender/items/0/additionalClassifications/0/id", "/tender/items/0/additionalClassifications/1/id"),
+        ("/tender/items/1/id", "/tender/items/2/id"),
     ):
-        assert key in root_table.combined_columns
-        assert key in root_table.columns
-    for key in ("/tender/items/2/id", "/tender/items/2/additionalClassifications/0/id"):
-        assert key not in root_table.combined_columns
+        columns.insert_after(last_key, key, replace(columns[last_key], path=key, hits=0))
+        order = list(columns)
+        assert order.index(key) == order.index(last_key) + 1
         assert key not in root_table.columns
 
-    items = [
-        {
-            "description": "Cycle path construction work",
-            "id": "45233162-2",
-            "scheme": "CPV",
-            "uri": "http://cpv.data.ac.uk/code-45233162.html",
-        }
-    ] * 2
-    insert_after_key(root_table.combined_columns, "/tender/items/0", "additionalClassifications")
-    for key in ("/tender/items/0/id", "/tender/items/0/additionalClassifications/0/id"):
-        assert key in root_table.combined_columns
-        assert key in root_table.columns
-    for key in (
-        "/tender/items/0/additionalClassifications/2/id",
-        "/tender/items/1/additionalClassifications/1/id",
-        "/tender/items/2/additionalClassifications/1/id",
-    ):
-        assert key not in root_table.combined_columns
-        assert key not in root_table.columns
-
-    items = releases[0]["tender"]["items"] * 5
-    insert_after_key(root_table.combined_columns, "/tender", "items")
-    for key in ("/tender/items/0/id", "/tender/items/0/additionalClassifications/0/id"):
-        assert key in root_table.combined_columns
-        assert key in root_table.columns
+    with pytest.raises(KeyError):
+        columns.insert_after("/tender/items/3/id", "/tender/items/4/id", columns["/tender/items/0/id"])
+    assert "/tender/items/4/id" not in columns
 
 
 def test_analyze_preview_rows(spec_analyzed, releases):
@@ -275,6 +477,36 @@ def test_analyze_preview_rows(spec_analyzed, releases):
                                                     assert value3 == resolve_pointer(releases[count], path)
 
 
+def test_analyze_without_preview(schema, spec, releases):
+    list(spec.process_items(releases))
+    other = DataPreprocessor(schema, TEST_ROOT_TABLES, combined_tables=TEST_COMBINED_TABLES)
+    list(other.process_items(releases, with_preview=False))
+
+    for name, table in spec.tables.items():
+        assert not other.tables[name].preview_rows
+        assert not other.tables[name].preview_rows_combined
+        assert other.tables[name].total_rows == table.total_rows
+        assert {col_id: col.hits for col_id, col in other.tables[name].combined_columns.items()} == {
+            col_id: col.hits for col_id, col in table.combined_columns.items()
+        }
+
+    disabled = DataPreprocessor(schema, TEST_ROOT_TABLES, combined_tables=TEST_COMBINED_TABLES, with_preview=False)
+    list(disabled.process_items(releases))
+    assert disabled.preview is None
+    assert not disabled.tables["tenders"].preview_rows
+
+
+def test_analyze_preview_collector(schema, releases):
+    spec = DataPreprocessor(
+        schema, TEST_ROOT_TABLES, combined_tables=TEST_COMBINED_TABLES, preview=PreviewCollector(2)
+    )
+    list(spec.process_items(releases))
+
+    tenders = spec.tables["tenders"]
+    assert len(tenders.preview_rows) == len(tenders.preview_rows_combined) == 2
+    assert [row["/tender/id"] for row in tenders.preview_rows] == [r["tender"]["id"] for r in releases[:2]]
+
+
 def test_analyze_array_extentions_no_split(spec, releases):
     attr = {"name": "Presentacion", "id": "1"}
     items = releases[0]["tender"]["items"]
@@ -360,3 +592,384 @@ def test_analyze_test_dataset(spec, test_dataset_releases):
 
 def test_analyze_with_combined_tables(spec, releases_with_combined_tables):
     list(spec.process_items(releases_with_combined_tables))
+
+
+def test_analyze_file_parallel(tmpdir):
+    path = Path(tmpdir) / "releases.jsonl"
+    with RELEASES_JSONL_PATH.open("rb") as fd:
+        path.write_bytes(fd.read() * 3)
+
+    serial = FileAnalyzer(tmpdir, schema=SCHEMA_PATH)
+    list(serial.analyze_file("releases.jsonl"))
+    parallel = FileAnalyzer(tmpdir, schema=SCHEMA_PATH)
+    list(parallel.analyze_file("releases.jsonl", workers=3))
+
+    assert parallel.spec.total_items == serial.spec.total_items
+    assert list(parallel.spec.tables) == list(serial.spec.tables)
+    for name, table in serial.spec.tables.items():
+        other = parallel.spec.tables[name]
+        assert other.total_rows == table.total_rows
+        assert other.arrays == table.arrays
+        assert other.child_tables == table.child_tables
+        for attr in ("columns", "combined_columns"):
+            expected = {col_id: col.hits for col_id, col in getattr(table, attr).items()}
+            assert {col_id: col.hits for col_id, col in getattr(other, attr).items()} == expected
+            assert list(getattr(other, attr)) == list(expected)
+        for attr in ("additional_columns", "array_columns"):
+            assert list(getattr(other, attr)) == list(getattr(table, attr))
+
+
+@pytest.mark.parametrize("schemaless", [False, True])
+def test_analyze_file_parallel_new_fields(tmpdir, schemaless):
+    with RELEASES_JSONL_PATH.open() as fd:
+        release = next(item for item in map(json.loads, fd) if "tender" in item)
+    path = Path(tmpdir) / "releases.jsonl"
+    with path.open("w") as fd:
+        for i in range(30):
+            item = json.loads(json.dumps(release))
+            # The last part finds a new field before the fields that the first part found.
+            if i >= 25:
+                item["tender"]["newField"] = "value"
+            if i in {5, 28}:
+                item["tender"]["extraArray"] = [{"a": 1, "b": 2}] * (1 if i == 5 else 3)
+                item["tender"]["items"] = [{"id": "1", "extra": 1}] * (i // 5)
+            fd.write(json.dumps(item) + "\n")
+
+    analyzers = []
+    for workers in (1, 3):
+        analyzer = FileAnalyzer(tmpdir, schema=SCHEMA_PATH, schemaless=schemaless)
+        list(analyzer.analyze_file("releases.jsonl", workers=workers))
+        analyzers.append(analyzer)
+    serial, parallel = analyzers
+
+    assert "/tender/newField" in serial.spec.tables["tenders"].combined_columns
+    assert list(parallel.spec.tables) == list(serial.spec.tables)
+    for name, table in serial.spec.tables.items():
+        other = parallel.spec.tables[name]
+        for attr in ("columns", "combined_columns", "array_columns"):
+            assert list(getattr(other, attr)) == list(getattr(table, attr)), (name, attr)
+        assert {col_id: col.hits for col_id, col in other.combined_columns.items()} == {
+            col_id: col.hits for col_id, col in table.combined_columns.items()
+        }
+
+
+def assert_same_analysis(actual, expected):
+    assert actual.total_items == expected.total_items
+    assert list(actual.tables) == list(expected.tables)
+    for name, table in expected.tables.items():
+        other = actual.tables[name]
+        for attr in ("columns", "combined_columns", "additional_columns", "array_columns"):
+            expected_columns = [(col_id, col.hits) for col_id, col in getattr(table, attr).items()]
+            assert [(col_id, col.hits) for col_id, col in getattr(other, attr).items()] == expected_columns, (
+                name,
+                attr,
+            )
+        for attr in (
+            "total_rows",
+            "arrays",
+            "types",
+            "child_tables",
+            "splitted",
+            "rolled_up",
+            "preview_rows",
+            "preview_rows_combined",
+        ):
+            assert getattr(other, attr) == getattr(table, attr), (name, attr)
+
+
+@pytest.mark.parametrize("table_threshold", [5, 100])
+def test_analyze_file_parallel_additional_fields_in_arrays(tmpdir, table_threshold):
+    path = Path(tmpdir) / "releases.jsonl"
+    with path.open("w") as fd:
+        items = [{"id": str(i)} for i in range(6)]
+        items[0]["extra1"] = "value"
+        items[5]["extra5"] = "value"
+        fd.write(json.dumps({"ocid": "ocds-1", "id": "1", "tender": {"id": "1", "items": items}}) + "\n")
+        items = [{"id": "0"}, {"id": "1", "extra5": "value"}]
+        fd.write(json.dumps({"ocid": "ocds-2", "id": "2", "tender": {"id": "2", "items": items}}) + "\n")
+
+    analyzers = []
+    for workers in (1, 2):
+        analyzer = FileAnalyzer(tmpdir, schema=SCHEMA_PATH, table_threshold=table_threshold)
+        list(analyzer.analyze_file("releases.jsonl", workers=workers))
+        analyzers.append(analyzer)
+    serial, parallel = analyzers
+
+    if table_threshold == 100:
+        assert "/tender/items/1/extra5" in serial.spec.tables["tenders"].combined_columns
+    else:
+        assert "/tender/items/0/extra1" in serial.spec.tables["tenders"].combined_columns
+    assert_same_analysis(parallel.spec, serial.spec)
+
+
+@pytest.mark.parametrize("seed", [0, 1])
+@pytest.mark.parametrize("table_threshold", [3, 100])
+@pytest.mark.parametrize("schemaless", [False, True])
+def test_analyze_file_parallel_random(tmpdir, seed, table_threshold, schemaless):
+    with RELEASES_JSONL_PATH.open() as fd:
+        releases = [json.loads(line) for line in fd]
+    rng = random.Random(seed)
+    path = Path(tmpdir) / "releases.jsonl"
+    with path.open("w") as fd:
+        for i in range(60):
+            release = copy.deepcopy(rng.choice(releases))
+            release["id"] = str(i)
+            tender = release.setdefault("tender", {"id": "1"})
+            # Additional fields inside arrays, and arrays that cross the threshold in some parts only.
+            tender["items"] = [{"id": str(j)} for j in range(rng.choice([0, 1, 2, 3, 4, 7]))]
+            for item in tender["items"]:
+                if rng.random() < 0.3:
+                    item[f"extra{rng.randint(0, 5)}"] = rng.choice(["value", 1])
+                if rng.random() < 0.2:
+                    item["additionalClassifications"] = [{"id": str(k)} for k in range(rng.randint(1, 6))]
+            if rng.random() < 0.2:
+                tender["extraArray"] = [{"a": 1, f"b{rng.randint(0, 2)}": 2} for _ in range(rng.randint(1, 6))]
+            if rng.random() < 0.1:
+                tender[f"newField{rng.randint(0, 2)}"] = "value"
+            fd.write(json.dumps(release) + "\n")
+
+    analyzers = []
+    for workers in (1, 3):
+        analyzer = FileAnalyzer(
+            tmpdir, schema=SCHEMA_PATH, schemaless=schemaless, table_threshold=table_threshold, preview_rows=3
+        )
+        list(analyzer.analyze_file("releases.jsonl", workers=workers))
+        analyzers.append(analyzer)
+    serial, parallel = analyzers
+
+    assert_same_analysis(parallel.spec, serial.spec)
+
+
+def test_analyze_file_backend(tmpdir):
+    expected = FileAnalyzer(tmpdir, schema=SCHEMA_PATH)
+    list(expected.analyze_file(RELEASES_JSONL_PATH))
+    analyzer = FileAnalyzer(tmpdir, schema=SCHEMA_PATH, backend="python")
+    list(analyzer.analyze_file(RELEASES_JSONL_PATH))
+
+    assert analyzer.spec.total_items == expected.spec.total_items
+    for name, table in expected.spec.tables.items():
+        assert analyzer.spec.tables[name].total_rows == table.total_rows
+
+
+def test_analyze_file_backend_invalid(tmpdir):
+    analyzer = FileAnalyzer(tmpdir, schema=SCHEMA_PATH, backend="missing")
+
+    with pytest.raises(ValueError, match="ijson backend missing is not available"):
+        list(analyzer.analyze_file(RELEASES_JSONL_PATH))
+
+
+@pytest.mark.parametrize(
+    ("suffix", "opener"),
+    [
+        ("gz", gzip.open),
+        ("bz2", bz2.open),
+        ("xz", lzma.open),
+        pytest.param(
+            "zst",
+            utils.zstd and utils.zstd.open,
+            marks=pytest.mark.skipif(utils.zstd is None, reason="no Zstandard decoder"),
+        ),
+    ],
+)
+def test_analyze_file_compressed(tmpdir, suffix, opener):
+    with gzip.open(RELEASES_GZ_PATH) as fd:
+        data = fd.read()
+    (Path(tmpdir) / "releases.json").write_bytes(data)
+    with opener(Path(tmpdir) / f"releases.json.{suffix}", "wb") as fd:
+        fd.write(data)
+    expected = FileAnalyzer(tmpdir, schema=SCHEMA_PATH)
+    list(expected.analyze_file("releases.json"))
+    analyzer = FileAnalyzer(tmpdir, schema=SCHEMA_PATH)
+    list(analyzer.analyze_file(f"releases.json.{suffix}"))
+
+    assert analyzer.spec.total_items == expected.spec.total_items
+    for name, table in expected.spec.tables.items():
+        other = analyzer.spec.tables[name]
+        assert other.total_rows == table.total_rows
+        assert {col_id: col.hits for col_id, col in other.combined_columns.items()} == {
+            col_id: col.hits for col_id, col in table.combined_columns.items()
+        }
+
+
+def test_analyze_file_progress(tmpdir):
+    calls = []
+    analyzer = FileAnalyzer(tmpdir, schema=SCHEMA_PATH)
+
+    results = list(analyzer.analyze_file(RELEASES_GZ_PATH, progress=lambda *args: calls.append(args)))
+
+    # The first item is reported immediately, and later items at most once per interval.
+    assert calls[0][1] == 0
+    assert len(calls) < len(results)
+    # The compressed file's position is reported.
+    assert calls[-1] == (RELEASES_GZ_PATH.stat().st_size, results[-1][1])
+
+
+def test_analyze_file_zstd_unavailable(tmpdir, monkeypatch):
+    path = Path(tmpdir) / "releases.json.zst"
+    path.write_bytes(utils.ZSTD_MAGIC_NUMBER + b"\x00" * 8)
+    monkeypatch.setattr(utils, "zstd", None)
+    analyzer = FileAnalyzer(tmpdir, schema=SCHEMA_PATH)
+
+    with pytest.raises(ValueError, match="Install zstandard"):
+        list(analyzer.analyze_file("releases.json.zst"))
+
+
+def test_analyze_file_gzip_truncated(tmpdir):
+    path = Path(tmpdir) / "releases.json.gz"
+    path.write_bytes(RELEASES_GZ_PATH.read_bytes()[:-100])
+    analyzer = FileAnalyzer(tmpdir, schema=SCHEMA_PATH)
+
+    with pytest.raises(EOFError):
+        list(analyzer.analyze_file("releases.json.gz"))
+
+
+def test_analyze_file_extensions(tmpdir):
+    url = "https://raw.githubusercontent.com/open-contracting-extensions/ocds_test_extension/master/extension.json"
+    package = {"extensions": [url], "releases": [{"ocid": "ocds-1", "id": "1", "tender": {"testField": "value"}}]}
+    (Path(tmpdir) / "package.json").write_text(json.dumps(package))
+    extension = Path(tmpdir) / "extensions" / "ocds_test_extension"
+    extension.mkdir(parents=True)
+    patch_ = {"definitions": {"Tender": {"properties": {"testField": {"title": "Test field", "type": "string"}}}}}
+    (extension / "release-schema.json").write_text(json.dumps(patch_))
+
+    analyzer = FileAnalyzer(tmpdir)
+    list(analyzer.analyze_file("package.json"))
+    assert "/tender/testField" in analyzer.spec["tenders"].additional_columns
+
+    for source in "package.json", io.BytesIO(json.dumps(package).encode()):
+        analyzer = FileAnalyzer(tmpdir, extensions=True, extension_dir=Path(tmpdir) / "extensions")
+        with patch("requests.get") as get:
+            list(analyzer.analyze_file(source))
+
+        get.assert_not_called()
+        table = analyzer.spec["tenders"]
+        assert "/tender/testField" not in table.additional_columns
+        assert table["/tender/testField"].hits == 1
+
+
+@patch("spoonbill.LOGGER.warning")
+def test_analyze_file_extensions_unavailable(log, tmpdir):
+    package = {"extensions": ["https://example.com/extension.json"], "releases": [{"ocid": "ocds-1", "id": "1"}]}
+    (Path(tmpdir) / "package.json").write_text(json.dumps(package))
+    analyzer = FileAnalyzer(tmpdir, extensions=True)
+    with patch("requests.get", side_effect=requests.ConnectionError("offline")):
+        results = list(analyzer.analyze_file("package.json"))
+
+    assert len(results) == 1
+    assert "Skipping extension https://example.com/extension.json" in log.call_args[0][0]
+
+
+def test_process_shapes(schema, releases):
+    expected = DataPreprocessor(schema, TEST_ROOT_TABLES, combined_tables=TEST_COMBINED_TABLES, with_preview=False)
+    list(expected.process_items(releases * 2))
+
+    spec = DataPreprocessor(schema, TEST_ROOT_TABLES, combined_tables=TEST_COMBINED_TABLES, with_preview=False)
+    shapes = {}
+    sequence = [shapes.setdefault(get_shape(release), len(shapes)) for release in releases * 2]
+    assert spec.process_shapes(list(shapes), sequence)
+    spec.clean_up_missing_arrays()
+
+    assert len(shapes) == len(releases)
+    assert_same_analysis(spec, expected)
+
+
+def test_process_shapes_previews(schema, releases):
+    expected = DataPreprocessor(schema, TEST_ROOT_TABLES, combined_tables=TEST_COMBINED_TABLES)
+    list(expected.process_items(releases * 2, start=5))
+
+    spec = DataPreprocessor(schema, TEST_ROOT_TABLES, combined_tables=TEST_COMBINED_TABLES)
+    shapes = {}
+    sequence = [shapes.setdefault(get_shape(release), len(shapes)) for release in releases * 2]
+    # The releases add preview rows, so they must be passed.
+    assert not spec.process_shapes(list(shapes), sequence, start=5, releases={})
+    assert not any(table.total_rows for table in spec.tables.values())
+    assert spec.process_shapes(list(shapes), sequence, start=5, releases=dict(enumerate(releases * 2)))
+    spec.clean_up_missing_arrays()
+
+    assert_same_analysis(spec, expected)
+
+
+def test_merge(schema, releases):
+    expected = DataPreprocessor(schema, TEST_ROOT_TABLES, combined_tables=TEST_COMBINED_TABLES)
+    list(expected.process_items(releases))
+
+    spec = DataPreprocessor(schema, TEST_ROOT_TABLES, combined_tables=TEST_COMBINED_TABLES)
+    list(spec.process_items(releases[:2]))
+    other = DataPreprocessor(spec.schema, TEST_ROOT_TABLES, combined_tables=TEST_COMBINED_TABLES)
+    list(other.process_items(releases[2:]))
+    spec.merge(other)
+
+    assert spec.total_items == expected.total_items
+    assert list(spec.tables) == list(expected.tables)
+    for name, table in expected.tables.items():
+        merged = spec.tables[name]
+        assert merged.total_rows == table.total_rows
+        assert merged.arrays == table.arrays
+        assert merged.child_tables == table.child_tables
+        assert {col_id: col.hits for col_id, col in merged.combined_columns.items()} == {
+            col_id: col.hits for col_id, col in table.combined_columns.items()
+        }
+        for attr in ("columns", "combined_columns", "additional_columns", "array_columns"):
+            assert list(getattr(merged, attr)) == list(getattr(table, attr))
+
+
+def test_merge_split(schema, releases):
+    spec = DataPreprocessor(schema, TEST_ROOT_TABLES, combined_tables=TEST_COMBINED_TABLES, table_threshold=3)
+    list(spec.process_items(releases[:1]))
+    assert "/tender/items/0/id" in spec.tables["tenders"].combined_columns
+
+    releases[1]["tender"]["items"] = releases[1]["tender"]["items"] * 3
+    other = DataPreprocessor(spec.schema, TEST_ROOT_TABLES, combined_tables=TEST_COMBINED_TABLES, table_threshold=3)
+    list(other.process_items(releases[1:2]))
+    spec.merge(other)
+
+    tenders = spec.tables["tenders"]
+    assert tenders.splitted
+    assert spec.tables["tenders_items"].rolled_up
+    assert tenders.arrays["/tender/items"] == len(releases[1]["tender"]["items"])
+    assert "/tender/items/0/id" not in tenders.combined_columns
+
+
+def test_merge_split_before(schema, releases):
+    spec = DataPreprocessor(schema, TEST_ROOT_TABLES, combined_tables=TEST_COMBINED_TABLES, table_threshold=3)
+    items = releases[1]["tender"]["items"]
+    releases[0]["tender"]["items"] = items * 3
+    # This column is added after the array is split.
+    releases[1]["tender"]["items"] = [{**items[0], "extra": "value"}]
+    # The array is also split in the other analysis.
+    releases[2]["tender"]["items"] = items * 4
+    list(spec.process_items(releases[:2]))
+    assert "/tender/items/0/extra" in spec.tables["tenders"].combined_columns
+
+    other = DataPreprocessor(spec.schema, TEST_ROOT_TABLES, combined_tables=TEST_COMBINED_TABLES, table_threshold=3)
+    list(other.process_items(releases[2:]))
+    spec.merge(other)
+
+    assert spec.tables["tenders"].splitted
+    assert "/tender/items/0/extra" in spec.tables["tenders"].combined_columns
+
+
+def test_merge_total_items(schema, releases):
+    expected = DataPreprocessor(schema, TEST_ROOT_TABLES, combined_tables=TEST_COMBINED_TABLES)
+    list(expected.process_items(releases[:2]))
+
+    spec = DataPreprocessor(schema, TEST_ROOT_TABLES, combined_tables=TEST_COMBINED_TABLES)
+    other = DataPreprocessor(spec.schema, TEST_ROOT_TABLES, combined_tables=TEST_COMBINED_TABLES)
+    list(other.process_items(releases[:2]))
+    spec.merge(other)
+
+    assert spec.total_items == expected.total_items == 1
+
+    empty = DataPreprocessor(spec.schema, TEST_ROOT_TABLES, combined_tables=TEST_COMBINED_TABLES)
+    list(empty.process_items([]))
+    spec.merge(empty)
+
+    assert spec.total_items == 1
+
+
+def test_merge_invalid(schema, spec):
+    other = DataPreprocessor(schema, TEST_ROOT_TABLES, combined_tables=TEST_COMBINED_TABLES, table_threshold=10)
+    with pytest.raises(ValueError, match="different schemas"):
+        spec.merge(other)
+    with pytest.raises(ValueError, match="itself"):
+        spec.merge(spec)
@@ -1,17 +1,32 @@
 import csv
+import gzip
+import io
+import pickle
 from pathlib import Path
 from unittest.mock import call, patch
 
 import openpyxl
+import pytest
 from scalpl import Cut
 
 from spoonbill import FileAnalyzer, FileFlattener
 from spoonbill.flatten import Flattener, FlattenOptions
-from spoonbill.utils import SchemaHeaderExtractor, add_paths_to_schema, generate_paths
+from spoonbill.utils import (
+    ITEMS_GZIP,
+    ITEMS_MAGIC_NUMBER,
+    RewindableReader,
+    SchemaHeaderExtractor,
+    add_paths_to_schema,
+    dump_items,
+    generate_paths,
+    load_items,
+    open_items,
+    open_items_writer,
+)
 from spoonbill.writers.csv import CSVWriter
 from spoonbill.writers.xlsx import XlsxWriter
 from tests import get_writers, prepare_tables, read_csv_headers, read_xlsx_headers
-from tests.data import RELEASES_EXTENSION_PATH, RELEASES_PATH
+from tests.data import RELEASES_EXTENSION_PATH, RELEASES_JSONL_PATH, RELEASES_PATH, SCHEMA_PATH
 
 ID_FIELDS = {"tenders": "/tender/id", "parties": "/parties/id"}
 
@@ -85,21 +100,21 @@ def test_writers_pretty_headers(spec, tmpdir, releases, schema):
             "Tender: Tender Title",
             "Tender: Value: Amount",
             "Tender: Value: Currency",
-            "Tender: Tender Period: Duration ( Days)",
+            "Tender: Tender Period: Duration (Days)",
             "Tender: Tender Period: End Date",
             "Tender: Tender Period: Start Date",
             "Tender: Tenderers: Organization Id",
             "Tender: Tenderers: Organization Name",
             "Tender: Value: Amount",
             "Tender: Value: Currency",
-            "Tender: Tender Period: Duration ( Days)",
+            "Tender: Tender Period: Duration (Days)",
             "Tender: Tender Period: End Date",
             "Tender: Tender Period: Start Date",
-            "Tender: Tender Period: Duration ( Days)",
+            "Tender: Tender Period: Duration (Days)",
             "Tender: Tender Period: End Date",
             "Tender: Tender Period: Start Date",
             "Tender: Tender Period: End Date",
-            "Tender: Tender period: Start date",
+            "Tender: Tender Period: Start Date",
         ],
         "parties": [
             "Ocid",
@@ -471,6 +486,116 @@ def test_flatten_multiple_files(spec, tmpdir, releases, schema):
         assert ws.max_row - 1 == line_number * 2
 
 
+def test_flatten_parallel(spec, tmpdir, releases, schema):
+    for _ in spec.process_items(releases):
+        pass
+    options = FlattenOptions(selection={"tenders": {"split": True}, "parties": {"split": False}})
+
+    outputs = []
+    for workers in (1, 2):
+        workdir = Path(tmpdir) / str(workers)
+        workdir.mkdir()
+        flattener = FileFlattener(workdir=workdir, options=options, tables=spec.tables, csv=True, schema=schema)
+        counts = list(flattener.flatten_file([RELEASES_PATH, RELEASES_PATH, RELEASES_PATH], workers=workers))
+        outputs.append({path.name: path.read_bytes() for path in workdir.glob("*.csv")})
+        with open(workdir / "result.xlsx", "rb") as f:
+            wb = openpyxl.load_workbook(f)
+            outputs.append({name: [[c.value for c in row] for row in wb[name].rows] for name in wb.sheetnames})
+
+    assert counts[-1] == 3 * len(releases) - 1
+    assert outputs[0]
+    assert outputs[0] == outputs[2]
+    assert outputs[1] == outputs[3]
+
+
+def test_flatten_parallel_single_part(spec, tmpdir, releases, schema):
+    for _ in spec.process_items(releases):
+        pass
+    options = FlattenOptions(selection={"tenders": {"split": True}, "parties": {"split": False}})
+    path = Path(tmpdir) / "releases.jsonl.gz"
+    path.write_bytes(gzip.compress(RELEASES_JSONL_PATH.read_bytes()))
+
+    outputs = []
+    for workers in (1, 3):
+        workdir = Path(tmpdir) / str(workers)
+        workdir.mkdir()
+        flattener = FileFlattener(
+            workdir=workdir, options=options, tables=spec.tables, csv=True, schema=schema, multiple_values=True
+        )
+        # A compressed file can't be split, so it's flattened without worker processes.
+        with patch("spoonbill.ProcessPoolExecutor") as pool:
+            list(flattener.flatten_file(path, workers=workers))
+        pool.assert_not_called()
+        outputs.append({path.name: path.read_bytes() for path in workdir.glob("*.csv")})
+
+    assert outputs[0]
+    assert outputs[0] == outputs[1]
+
+
+def test_flatten_spool(tmpdir):
+    workdir = Path(tmpdir)
+    path = workdir / "releases.json"
+    path.write_bytes(RELEASES_PATH.read_bytes())
+    options = FlattenOptions(selection={"tenders": {"split": True}, "parties": {"split": False}})
+
+    outputs = []
+    for spool in (False, True):
+        analyzer = FileAnalyzer(workdir, schema=SCHEMA_PATH)
+        list(analyzer.analyze_file("releases.json", spool=spool))
+        if spool:
+            path.unlink()
+        flattener = FileFlattener(workdir, options, analyzer, csv=True)
+        list(flattener.flatten_file("releases.json"))
+        outputs.append({name: (workdir / f"{name}.csv").read_bytes() for name in ("tenders", "parties")})
+
+    assert outputs[0] == outputs[1]
+
+
+def test_flatten_cache(tmpdir):
+    workdir = Path(tmpdir)
+    path = workdir / "releases.json"
+    path.write_bytes(RELEASES_PATH.read_bytes())
+    options = FlattenOptions(selection={"tenders": {"split": True}, "parties": {"split": False}})
+
+    analyzer = FileAnalyzer(workdir, schema=SCHEMA_PATH)
+    list(analyzer.analyze_file("releases.json", cache="releases.cache"))
+    analyzer.dump_to_file("releases.state")
+    analyzer.spool.close()
+    flattener = FileFlattener(workdir, options, tables=analyzer.spec.tables, csv=True, schema=analyzer.spec.schema)
+    list(flattener.flatten_file("releases.json"))
+    expected = {name: (workdir / f"{name}.csv").read_bytes() for name in ("tenders", "parties")}
+
+    path.unlink()
+    analyzer = FileAnalyzer(workdir, state_file=workdir / "releases.state")
+    flattener = FileFlattener(workdir, options, analyzer, csv=True, cache="releases.cache")
+    counts = list(flattener.flatten_file("releases.json"))
+
+    assert counts[-1] == analyzer.spec.total_items
+    assert {name: (workdir / f"{name}.csv").read_bytes() for name in ("tenders", "parties")} == expected
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_load_items_magic_number(compress):
+    # A frame of 0x8b1f bytes has a header that starts like gzip's magic number.
+    size = 0x8B1F
+    item = {"id": "x" * 300}
+    item["id"] = "x" * (size - len(pickle.dumps(item, protocol=pickle.HIGHEST_PROTOCOL)) + 300)
+    assert len(pickle.dumps(item, protocol=pickle.HIGHEST_PROTOCOL)) == size
+    buf = io.BytesIO()
+    writer = open_items_writer(buf, compress=compress)
+    list(dump_items([item, {"id": "y"}], writer))
+    if writer is not buf:
+        writer.close()
+    buf.seek(0)
+
+    assert list(load_items(open_items(buf))) == [item, {"id": "y"}]
+
+
+def test_open_items_invalid():
+    with pytest.raises(ValueError, match="isn't a cache of parsed items"):
+        open_items(io.BytesIO(b"\x1f\x8b\x00\x00"))
+
+
 def test_extension_export(spec, tmpdir, releases_extension, schema):
     for _ in spec.process_items(releases_extension):
         pass
@@ -518,3 +643,123 @@ def test_schema_header_generation(schema):
         ["parties", "items", "properties", "contactPoint", "properties", "name", "title"],
     ]
     assert headers.get_header("", paths) == "Parties: Organization: Contact point: Name"
+
+
+def test_schema_table_header(spec_analyzed, schema):
+    headers = SchemaHeaderExtractor(schema, "en")
+    table = spec_analyzed.tables["tenders"]
+
+    assert headers.get_table_header(table, "/tender/id") == "Tender: Tender Id"
+    header = headers.get_table_header(table, "/tender/tenderers/0/id")
+    assert headers.get_table_header(table, "/tender/tenderers/12/id") == header
+    assert headers.get_table_header(table, "/tender/test_1") == "Tender: Test 1"
+    assert table.human_headers["en"]["/tender/tenderers/12/id"] == header
+
+
+def test_writers_pretty_headers_shared(spec, tmpdir, releases, schema):
+    list(spec.process_items(releases))
+    spec.resolve_headers()
+    options = FlattenOptions(selection={"tenders": {"split": True, "pretty_headers": True}})
+    tables = prepare_tables(spec, options)
+
+    with patch.object(SchemaHeaderExtractor, "get_header") as get_header:
+        get_writers(Path(tmpdir), tables, options, schema)
+
+    get_header.assert_not_called()
+    assert "Tender: Tender Id" in read_csv_headers(Path(tmpdir) / "tenders.csv")
+
+
+def test_flatten_progress(tmpdir):
+    workdir = Path(tmpdir)
+    path = workdir / "releases.json"
+    path.write_bytes(RELEASES_PATH.read_bytes())
+    options = FlattenOptions(selection={"tenders": {"split": True}, "parties": {"split": False}})
+    analyzer = FileAnalyzer(workdir, schema=SCHEMA_PATH)
+    list(analyzer.analyze_file("releases.json"))
+    flattener = FileFlattener(workdir, options, analyzer, csv=True)
+    calls = []
+
+    counts = list(flattener.flatten_file("releases.json", progress=calls.append))
+
+    assert calls[0] == 0
+    assert calls[-1] == counts[-1]
+    assert len(calls) < len(counts)
+
+
+class Stream:
+    """A non-seekable stream."""
+
+    def __init__(self, data):
+        self.fd = io.BytesIO(data)
+
+    def read(self, size=-1):
+        return self.fd.read(size)
+
+
+def test_rewindable_reader_spill():
+    data = bytes(range(256)) * 40
+    reader = RewindableReader(io.BytesIO(data), max_buffer=1000)
+
+    assert reader.read(5000) == data[:5000]
+    assert len(reader.buffer) <= 1000
+    assert reader.spill is not None
+
+    reader.rewind(keep=True)
+    assert reader.read(7000) == data[:7000]
+    assert len(reader.buffer) <= 1000
+
+    reader.rewind()
+    assert reader.read(3) == data[:3]
+    assert reader.read() == data[3:]
+    assert reader.tell() == len(data)
+    assert reader.spill is None
+    assert not reader.buffer
+
+
+def test_analyze_file_stream_buffer(tmpdir):
+    readers = []
+
+    class Reader(RewindableReader):
+        def __init__(self, fd):
+            super().__init__(fd, max_buffer=1024)
+            self.peak = 0
+            readers.append(self)
+
+        def read(self, size=-1):
+            data = super().read(size)
+            self.peak = max(self.peak, len(self.buffer))
+            return data
+
+    expected = FileAnalyzer(tmpdir, schema=SCHEMA_PATH)
+    list(expected.analyze_file(RELEASES_PATH))
+
+    analyzer = FileAnalyzer(tmpdir, schema=SCHEMA_PATH)
+    with patch("spoonbill.RewindableReader", Reader):
+        list(analyzer.analyze_file(Stream(RELEASES_PATH.read_bytes())))
+
+    # The format is sniffed by reading the whole package, but the bytes kept in memory are bounded.
+    assert readers
+    assert readers[0].peak <= 1024
+    assert analyzer.spec.total_items == expected.spec.total_items
+    assert {name: table.total_rows for name, table in analyzer.spec.tables.items()} == {
+        name: table.total_rows for name, table in expected.spec.tables.items()
+    }
+
+
+def test_flatten_stream(tmpdir):
+    workdir = Path(tmpdir)
+    options = FlattenOptions(selection={"tenders": {"split": True}, "parties": {"split": False}})
+    analyzer = FileAnalyzer(workdir, schema=SCHEMA_PATH)
+    list(analyzer.analyze_file(RELEASES_PATH))
+    list(FileFlattener(workdir, options, analyzer, csv=True).flatten_file(RELEASES_PATH))
+    expected = {name: (workdir / f"{name}.csv").read_bytes() for name in ("tenders", "parties")}
+
+    for data in (RELEASES_PATH.read_bytes(), gzip.compress(RELEASES_PATH.read_bytes())):
+        analyzer = FileAnalyzer(workdir, schema=SCHEMA_PATH)
+        list(analyzer.analyze_file(Stream(data)))
+        list(FileFlattener(workdir, options, analyzer, csv=True).flatten_file(None))
+
+        assert {name: (workdir / f"{name}.csv").read_bytes() for name in ("tenders", "parties")} == expected
+        # The spool is compressed.
+        analyzer.spool.seek(0)
+        assert analyzer.spool.read(len(ITEMS_MAGIC_NUMBER) + 1) == ITEMS_MAGIC_NUMBER + ITEMS_GZIP